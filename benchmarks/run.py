@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from src.utils.pagination import encode_cursor
+from .settings import BENCH_USER_EMAIL, BENCH_USER_PASSWORD, SCALES
+
+SEARCH_WORDS = ["war", "river", "garden", "storm", "tolstoy", "tolkien", "silver", "night"]
+SORTS = ["id", "-id", "title", "publication_year"]
+
+
+class Context:
+    def __init__(self, books: int, readers: int, token: Optional[str]):
+        self.books = books
+        self.readers = readers
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+
+Scenario = Callable[[httpx.AsyncClient, random.Random, Context], Awaitable[bool]]
+
+
+def _ok(response: httpx.Response) -> bool:
+    return response.status_code < 400
+
+
+async def token(client, rng, context) -> bool:
+    response = await client.post(
+        "/token", data={"username": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD}
+    )
+    return _ok(response)
+
+
+async def list_books(client, rng, context) -> bool:
+    # Страница из середины каталога через курсор: глубина не должна влиять на время
+    params = {"limit": 50, "after": encode_cursor("id", None, rng.randint(1, context.books))}
+    if rng.random() < 0.5:
+        params = {"limit": 50, "sort": rng.choice(SORTS), "year_from": rng.randint(1800, 2000)}
+    return _ok(await client.get("/books/books/", params=params))
+
+
+async def read_book(client, rng, context) -> bool:
+    return _ok(await client.get(f"/books/books/{rng.randint(1, context.books)}"))
+
+
+async def search(client, rng, context) -> bool:
+    return _ok(await client.get("/books/search", params={"q": rng.choice(SEARCH_WORDS)}))
+
+
+async def list_readers(client, rng, context) -> bool:
+    return _ok(await client.get(
+        "/readers/readers/", params={"limit": 50}, headers=context.headers
+    ))
+
+
+async def borrow_return(client, rng, context) -> bool:
+    # Полный цикл: выдача и сразу возврат, в замер идут оба запроса
+    borrow = {
+        "book_id": rng.randint(1, context.books),
+        "reader_id": rng.randint(1, context.readers),
+    }
+    response = await client.post("/borrowed-books/borrow/", json=borrow, headers=context.headers)
+    if not _ok(response):
+        return False
+    borrow_id = response.json()["id"]
+    response = await client.post(f"/borrowed-books/return/{borrow_id}", headers=context.headers)
+    return _ok(response)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "token": token,
+    "list_books": list_books,
+    "read_book": read_book,
+    "search": search,
+    "list_readers": list_readers,
+    "borrow_return": borrow_return,
+}
+
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    context: Context,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(number: int, deadline: float, record: bool) -> None:
+        nonlocal errors
+        rng = random.Random(seed * 1000 + number)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = await scenario(client, rng, context)
+            except httpx.HTTPError:
+                ok = False
+            if record:
+                latencies.append(time.perf_counter() - started)
+                errors += not ok
+
+    if warmup > 0:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(worker(number, deadline, False) for number in range(concurrency)))
+
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(number, deadline, True) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def _client(url: Optional[str], concurrency: int) -> httpx.AsyncClient:
+    if url:
+        return httpx.AsyncClient(
+            base_url=url,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=60
+        )
+    # Приложение в том же процессе, без сети и uvicorn: DATABASE_URL берется из окружения.
+    # Все клиенты прогона приходят с одного адреса, поэтому лимиты запросов отключаются
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    from main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _database(url: Optional[str]) -> str:
+    if url:
+        return "remote"
+    from src.database.database import engine
+
+    return engine.dialect.name
+
+
+async def run(args) -> dict:
+    results = {
+        "meta": {
+            "at": datetime.utcnow().isoformat(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "database": _database(args.url),
+            "target": args.url or "in-process",
+            "books": args.books,
+            "readers": args.readers,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+        },
+        "scenarios": {},
+    }
+    async with _client(args.url, args.concurrency) as client:
+        response = await client.post(
+            "/token", data={"username": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD}
+        )
+        response.raise_for_status()
+        context = Context(args.books, args.readers, response.json()["access_token"])
+        for name in args.scenarios:
+            sys.stderr.write(f"{name}...\n")
+            results["scenarios"][name] = await run_scenario(
+                client, SCENARIOS[name], context,
+                args.concurrency, args.duration, args.warmup, args.seed
+            )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    # Регрессия: p95 вырос или RPS упал больше чем на tolerance
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+    return regressions
+
+
+def print_table(results: dict, baseline: Optional[dict]) -> None:
+    columns = ["rps", "p50_ms", "p95_ms", "p99_ms", "errors"]
+    print(f"{'scenario':<15}" + "".join(f"{column:>20}" for column in columns))
+    for name, current in results["scenarios"].items():
+        previous = (baseline or {}).get("scenarios", {}).get(name, {})
+        cells = []
+        for column in columns:
+            cell = f"{current[column]}"
+            if previous.get(column):
+                change = (current[column] - previous[column]) / previous[column] * 100
+                cell += f" ({change:+.0f}%)"
+            cells.append(f"{cell:>20}")
+        print(f"{name:<15}" + "".join(cells))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Drive the API with concurrent clients and report latency percentiles"
+    )
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="smoke")
+    parser.add_argument("--books", type=int)
+    parser.add_argument("--readers", type=int)
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS),
+        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a results file from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    args.books = args.books or SCALES[args.scale]["books"]
+    args.readers = args.readers or SCALES[args.scale]["readers"]
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_table(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
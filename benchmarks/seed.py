@@ -0,0 +1,161 @@
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, insert, select, update
+
+from src.auth.auth import get_password_hash
+from src.database.database import SessionLocal, engine
+from src.models.models import Base, Book, BorrowedBook, Reader, User
+from src.services.loans import repair_counters
+
+from .settings import BENCH_USER_EMAIL, BENCH_USER_PASSWORD, SCALES
+
+# Строк в одном INSERT и одной транзакции
+CHUNK_SIZE = 10_000
+# Доля выдач, которые еще не возвращены (не больше MAX_ACTIVE_BORROWS на читателя)
+ACTIVE_SHARE = 0.01
+
+WORDS = [
+    "war", "peace", "night", "river", "garden", "winter", "house", "road", "silver", "storm",
+    "island", "letter", "shadow", "empire", "journey", "mirror", "forest", "city", "ocean", "fire",
+]
+SURNAMES = [
+    "Tolstoy", "Chekhov", "Pushkin", "Gogol", "Bulgakov", "Turgenev", "Austen", "Dickens",
+    "Tolkien", "Orwell", "Hugo", "Dumas", "Twain", "Woolf", "Kafka", "Borges", "Eco", "Mann",
+]
+
+
+def _chunks(total: int):
+    for start in range(0, total, CHUNK_SIZE):
+        yield start, min(start + CHUNK_SIZE, total)
+
+
+def _book(rng: random.Random, number: int) -> dict:
+    return {
+        "id": number,
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).capitalize(),
+        "author": f"{rng.choice(SURNAMES)} {number % 997}",
+        "publication_year": rng.randint(1800, 2024) if rng.random() > 0.05 else None,
+        "isbn": f"978{number:010d}",
+        "copies_available": rng.randint(1, 10),
+        "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))),
+    }
+
+
+def _progress(label: str, done: int, total: int, started: float) -> None:
+    rate = done / max(time.perf_counter() - started, 1e-9)
+    sys.stderr.write(f"\r{label}: {done}/{total} ({rate:,.0f} rows/s)")
+    if done == total:
+        sys.stderr.write("\n")
+
+
+def seed(books: int, readers: int, borrows: int, random_seed: int = 42) -> None:
+    # Данные детерминированы: одинаковые параметры дают одинаковую базу
+    rng = random.Random(random_seed)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with SessionLocal() as db:
+        db.execute(insert(User), [{
+            "email": BENCH_USER_EMAIL,
+            "hashed_password": get_password_hash(BENCH_USER_PASSWORD),
+            "is_active": True,
+        }])
+
+        started = time.perf_counter()
+        for start, end in _chunks(books):
+            db.execute(insert(Book), [_book(rng, number) for number in range(start + 1, end + 1)])
+            db.commit()
+            _progress("books", end, books, started)
+
+        started = time.perf_counter()
+        for start, end in _chunks(readers):
+            db.execute(insert(Reader), [
+                {"id": number, "name": f"Reader {number}", "email": f"reader{number}@example.com"}
+                for number in range(start + 1, end + 1)
+            ])
+            db.commit()
+            _progress("readers", end, readers, started)
+
+        # История выдач за последние пять лет; активные выдачи — у первых
+        # читателей, по одной-две на читателя
+        active = min(int(borrows * ACTIVE_SHARE), readers * 2)
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        for start, end in _chunks(borrows):
+            rows = []
+            for number in range(start, end):
+                borrowed_at = now - timedelta(minutes=rng.randint(60, 5 * 365 * 24 * 60))
+                if number < active:
+                    reader_id, returned_at = number % readers + 1, None
+                else:
+                    reader_id = rng.randint(1, readers)
+                    returned_at = borrowed_at + timedelta(days=rng.randint(1, 60))
+                rows.append({
+                    "book_id": rng.randint(1, books),
+                    "reader_id": reader_id,
+                    "borrow_date": borrowed_at,
+                    "return_date": returned_at,
+                })
+            db.execute(insert(BorrowedBook), rows)
+            db.commit()
+            _progress("borrowed_books", end, borrows, started)
+
+        # Остатки уменьшаются на число активных выдач, чтобы данные были согласованы
+        active_by_book = (
+            select(func.count())
+            .where(BorrowedBook.book_id == Book.id, BorrowedBook.return_date.is_(None))
+            .scalar_subquery()
+        )
+        remaining = Book.copies_available - active_by_book
+        db.execute(
+            update(Book)
+            .where(Book.id.in_(
+                select(BorrowedBook.book_id).where(BorrowedBook.return_date.is_(None))
+            ))
+            .values(copies_available=case((remaining < 0, 0), else_=remaining))
+        )
+        db.commit()
+        # Счетчики active_loans у читателей — по тем же активным выдачам
+        repair_counters(db)
+
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            # Идентификаторы вставлены явно — сдвигаем последовательности
+            for table in ("books", "readers"):
+                connection.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT max(id) FROM {table}))"
+                )
+        else:
+            connection.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('optimize')")
+        connection.exec_driver_sql("ANALYZE")
+        connection.commit()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.seed",
+        description="Fill DATABASE_URL with synthetic benchmark data (drops existing tables)"
+    )
+    parser.add_argument("--scale", choices=sorted(SCALES), default="smoke")
+    parser.add_argument("--books", type=int)
+    parser.add_argument("--readers", type=int)
+    parser.add_argument("--borrows", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    volumes = dict(SCALES[args.scale])
+    for key in volumes:
+        if getattr(args, key) is not None:
+            volumes[key] = getattr(args, key)
+    print(f"Seeding {engine.url.render_as_string()} with {volumes}")
+    seed(random_seed=args.seed, **volumes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+import httpx
+
+from .run import percentile
+from .settings import BENCH_USER_EMAIL, BENCH_USER_PASSWORD
+
+# Кэш каталога отключается, иначе сравнивались бы попадания в кэш
+os.environ.setdefault("RESPONSE_CACHE_MAX_ENTRIES", "0")
+# Большие страницы подпадают под лимит тяжелых запросов
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+ENDPOINTS = ["/books/books/", "/readers/readers/", "/borrowed-books/borrowed-books/"]
+
+
+async def measure(
+    client: httpx.AsyncClient, url: str, params: dict, headers: dict, repeat: int
+) -> float:
+    latencies: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get(url, params=params, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+    latencies.sort()
+    return percentile(latencies, 0.5) * 1000
+
+
+async def run(limits: List[int], repeat: int) -> None:
+    # Приложение в том же процессе на базе из DATABASE_URL (см. benchmarks.seed)
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post(
+            "/token", data={"username": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD}
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        print(f"{'endpoint':<34}{'limit':>7}{'regular p50':>14}{'fast p50':>11}{'speedup':>10}")
+        for url in ENDPOINTS:
+            for limit in limits:
+                params = {"limit": limit}
+                # Прогрев: первые запросы компилируют SQL и заполняют кэши драйвера
+                await measure(client, url, params, headers, 3)
+                await measure(client, url, {**params, "fast": "true"}, headers, 3)
+                regular = await measure(client, url, params, headers, repeat)
+                fast = await measure(client, url, {**params, "fast": "true"}, headers, repeat)
+                print(
+                    f"{url:<34}{limit:>7}{regular:>12.2f}ms{fast:>9.2f}ms{regular / fast:>9.2f}x"
+                )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.serialization",
+        description="Compare regular and ?fast=true list responses on a seeded database"
+    )
+    parser.add_argument("--limits", default="100,1000,5000")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args(argv)
+    limits = [int(limit) for limit in args.limits.split(",")]
+    asyncio.run(run(limits, args.repeat))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
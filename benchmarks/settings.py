@@ -0,0 +1,8 @@
+# Объемы данных: smoke — для быстрой проверки, large — целевой объем каталога
+SCALES = {
+    "smoke": {"books": 10_000, "readers": 1_000, "borrows": 50_000},
+    "medium": {"books": 100_000, "readers": 10_000, "borrows": 1_000_000},
+    "large": {"books": 1_000_000, "readers": 100_000, "borrows": 10_000_000},
+}
+BENCH_USER_EMAIL = "bench@example.com"
+BENCH_USER_PASSWORD = "bench-password"
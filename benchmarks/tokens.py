@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import sys
+import time
+from datetime import timedelta
+from typing import Callable
+
+from jose import jwt
+from sqlalchemy import select
+
+from src.auth.auth import (
+    ALGORITHM, SECRET_KEY, create_access_token, get_current_user, signing_key, token_claims
+)
+from src.auth.revocation import revocations
+from src.database.database import AsyncSessionLocal, SessionLocal, engine
+from src.models.models import Base, User
+
+from .settings import BENCH_USER_EMAIL
+
+# Проверка токенов в одном потоке, то есть на одно ядро: подпись с разбором
+# ключа на каждый вызов (как было), с закэшированным ключом, полный
+# get_current_user по claims со списком отзыва и по токену старого формата
+# (только sub) с пользователем из кэша
+
+
+def rate(call: Callable[[], object], duration: float) -> float:
+    count = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            call()
+        count += 100
+    return count / (time.perf_counter() - started)
+
+
+async def current_user_rate(token: str, duration: float) -> float:
+    async with AsyncSessionLocal() as db:
+        await revocations.refresh(db)
+        count = 0
+        started = time.perf_counter()
+        deadline = started + duration
+        while time.perf_counter() < deadline:
+            for _ in range(100):
+                await get_current_user(token=token, db=db)
+            count += 100
+        return count / (time.perf_counter() - started)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.tokens",
+        description="Measure access tokens verified per second on a single core"
+    )
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per measurement")
+    args = parser.parse_args(argv)
+
+    # Пользователь нужен токену старого формата, список отзыва читается из users
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        user = db.execute(select(User).where(User.email == BENCH_USER_EMAIL)).scalar()
+        if user is None:
+            user = User(email=BENCH_USER_EMAIL, hashed_password="-", is_active=True)
+            db.add(user)
+            db.commit()
+        claims = token_claims(user)
+    expires = timedelta(minutes=30)
+    token = create_access_token(claims, expires_delta=expires)
+    legacy_token = create_access_token({"sub": claims["sub"]}, expires_delta=expires)
+    key = signing_key(SECRET_KEY, ALGORITHM)
+    results = {
+        "decode, key parsed per call": rate(
+            lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]), args.duration
+        ),
+        "decode, cached key": rate(
+            lambda: jwt.decode(token, key, algorithms=[ALGORITHM]), args.duration
+        ),
+        "get_current_user, claims": asyncio.run(current_user_rate(token, args.duration)),
+        "get_current_user, legacy token": asyncio.run(
+            current_user_rate(legacy_token, args.duration)
+        ),
+    }
+    for name, value in results.items():
+        print(f"{name:<32}{value:>12,.0f} tokens/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,8 +13,15 @@ from src.routers.auth import router as auth_router
 from src.routers.books import router as books_router
 from src.routers.readers import router as readers_router
 from src.routers.borrowed_books import router as borrowed_books_router
+from src.routers.system import router as system_router
+from src.routers.metrics import router as metrics_router
 from src.database.database import engine
+from src.metrics.middleware import MetricsMiddleware
+from src.metrics.profiling import ProfilingMiddleware
+from src.limits.middleware import RateLimitMiddleware
+from src.database.replicas import ReadYourWritesMiddleware
 from src.models.models import Base
+from src.utils.pagination import CURSOR_HEADER
 
 # Создаем таблицы в базе данных
 Base.metadata.create_all(bind=engine)
@@ -25,6 +32,11 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Лимиты запросов и контроль допуска (см. src/limits). Добавляются первыми,
+# то есть ближе всего к приложению: ответы 429/503 проходят через CORS и метрики
+app.add_middleware(RateLimitMiddleware)
+# Отметка о записи клиента для чтения из основной базы (см. src/database/replicas.py)
+app.add_middleware(ReadYourWritesMiddleware)
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,13 +44,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CURSOR_HEADER],
 )
+# Профилирование по заголовку X-Profile или выборке (см. src/metrics/profiling.py)
+app.add_middleware(ProfilingMiddleware)
+# Метрики добавляются последними, чтобы замер охватывал весь стек middleware
+app.add_middleware(MetricsMiddleware)
 
 # Подключаем роутеры
 app.include_router(auth_router, tags=["Authentication"])
 app.include_router(books_router, prefix="/books", tags=["Books"])
 app.include_router(readers_router, prefix="/readers", tags=["Readers"])
 app.include_router(borrowed_books_router, prefix="/borrowed-books", tags=["Borrowed Books"])
+app.include_router(system_router, prefix="/system", tags=["System"])
+app.include_router(metrics_router)
 
 @app.get("/")
 async def root():
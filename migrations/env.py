@@ -3,7 +3,6 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 from alembic import context
 from dotenv import load_dotenv
-import os
 import sys
 from pathlib import Path
 
@@ -17,6 +16,7 @@ load_dotenv()
 
 # Импортируем модели
 from src.models.models import Base
+from src.database.database import SYNC_DATABASE_URL
 
 # this is the Alembic Config object
 config = context.config
@@ -27,8 +27,8 @@ if config.config_file_name is not None:
 
 target_metadata = Base.metadata
 
-# URL базы данных из переменной окружения
-config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL"))
+# URL базы данных из переменной окружения (миграции всегда идут через синхронный драйвер)
+config.set_main_option("sqlalchemy.url", SYNC_DATABASE_URL)
 
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
@@ -45,7 +45,7 @@ def run_migrations_offline() -> None:
 def run_migrations_online() -> None:
     configuration = config.get_section(config.config_ini_section)
     assert configuration is not None
-    configuration["sqlalchemy.url"] = os.getenv("DATABASE_URL")
+    configuration["sqlalchemy.url"] = SYNC_DATABASE_URL
     connectable = engine_from_config(
         configuration,
         prefix="sqlalchemy.",
@@ -0,0 +1,49 @@
+"""Add indexes for filtered and sorted list queries
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+# Индексы, объявленные в моделях, но не созданные миграцией 001
+MODEL_INDEXES = [
+    ('ix_books_title', 'books', ['title']),
+    ('ix_books_author', 'books', ['author']),
+    ('ix_readers_name', 'readers', ['name']),
+]
+
+QUERY_INDEXES = [
+    ('ix_books_author_publication_year', 'books', ['author', 'publication_year']),
+    ('ix_books_publication_year_id', 'books', ['publication_year', 'id']),
+    ('ix_borrowed_books_reader_id_return_date', 'borrowed_books', ['reader_id', 'return_date']),
+    ('ix_borrowed_books_book_id_return_date', 'borrowed_books', ['book_id', 'return_date']),
+    ('ix_borrowed_books_borrow_date_id', 'borrowed_books', ['borrow_date', 'id']),
+]
+
+def upgrade() -> None:
+    for name, table, columns in MODEL_INDEXES + QUERY_INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+    # Частичный индекс по книгам, доступным для выдачи
+    op.create_index(
+        'ix_books_available', 'books', ['id'],
+        postgresql_where=sa.text('copies_available > 0'),
+        sqlite_where=sa.text('copies_available > 0'),
+        if_not_exists=True
+    )
+
+def downgrade() -> None:
+    op.drop_index('ix_books_available', table_name='books', if_exists=True)
+    # Индексы моделей тоже создает upgrade, иначе повторный upgrade после
+    # downgrade пропустил бы их (if_not_exists) с прежним определением
+    for name, table, _ in reversed(MODEL_INDEXES + QUERY_INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,39 @@
+"""Add denormalized active loan counter to readers
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # В SQLite ограничение нельзя добавить через ALTER TABLE: batch-режим
+    # пересоздает таблицу, в PostgreSQL выполняются обычные ALTER
+    with op.batch_alter_table('readers') as batch_op:
+        batch_op.add_column(
+            sa.Column('active_loans', sa.Integer(), nullable=False, server_default='0')
+        )
+        batch_op.create_check_constraint('check_active_loans', 'active_loans >= 0')
+
+    # Заполняем счетчик только у читателей с невозвращенными книгами,
+    # остальные уже получили 0 из значения по умолчанию
+    op.execute("""
+        UPDATE readers SET active_loans = (
+            SELECT COUNT(*) FROM borrowed_books
+            WHERE borrowed_books.reader_id = readers.id AND borrowed_books.return_date IS NULL
+        )
+        WHERE id IN (SELECT reader_id FROM borrowed_books WHERE return_date IS NULL)
+    """)
+
+def downgrade() -> None:
+    with op.batch_alter_table('readers') as batch_op:
+        batch_op.drop_constraint('check_active_loans', type_='check')
+        batch_op.drop_column('active_loans')
@@ -0,0 +1,31 @@
+"""Add token version and its change time to users for token revocation
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # У существующих пользователей версия 0: их токены остаются действительными
+    op.add_column('users',
+        sa.Column('token_version', sa.Integer(), nullable=False, server_default='0')
+    )
+    # Список отзыва читает только пользователей, измененных за время жизни
+    # токена доступа; у существующих пользователей изменений еще не было
+    op.add_column('users', sa.Column('tokens_changed_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_users_tokens_changed_at', 'users', ['tokens_changed_at'])
+
+def downgrade() -> None:
+    op.drop_index('ix_users_tokens_changed_at', table_name='users')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('tokens_changed_at')
+        batch_op.drop_column('token_version')
@@ -0,0 +1,54 @@
+"""Add non-negative copies check to books
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def _rebuild_books(change) -> None:
+    # В SQLite ограничение добавляется только пересозданием таблицы. Триггеры
+    # полнотекстового индекса (миграция 003) и индексы, которые batch-режим
+    # не воспроизводит, сохраняются до пересоздания и возвращаются после
+    bind = op.get_bind()
+    schema_sql = "SELECT name, sql FROM sqlite_master WHERE tbl_name = 'books' AND sql IS NOT NULL"
+    saved = [
+        (name, sql) for name, sql in bind.execute(
+            sa.text(schema_sql + " AND type IN ('trigger', 'index')")
+        )
+    ]
+    with op.batch_alter_table('books', recreate='always') as batch_op:
+        change(batch_op)
+    existing = {name for name, _ in bind.execute(sa.text(schema_sql))}
+    for name, sql in saved:
+        if name not in existing:
+            op.execute(sql)
+
+def upgrade() -> None:
+    # Отрицательные остатки могли появиться без ограничения (параллельные
+    # массовые выдачи): иначе ограничение не создастся
+    op.execute("UPDATE books SET copies_available = 0 WHERE copies_available < 0")
+    if op.get_bind().dialect.name == 'sqlite':
+        _rebuild_books(
+            lambda batch_op: batch_op.create_check_constraint(
+                'check_copies_available', 'copies_available >= 0'
+            )
+        )
+    else:
+        op.create_check_constraint('check_copies_available', 'books', 'copies_available >= 0')
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        _rebuild_books(
+            lambda batch_op: batch_op.drop_constraint('check_copies_available', type_='check')
+        )
+    else:
+        op.drop_constraint('check_copies_available', 'books', type_='check')
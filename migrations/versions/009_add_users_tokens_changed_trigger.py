@@ -0,0 +1,59 @@
+"""Stamp users.tokens_changed_at in the database
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+# Время изменения token_version и is_active ставит сама база: деактивация
+# пакетным UPDATE или скриптом в обход ORM тоже попадает в список отзыва
+SQLITE_STATEMENTS = [
+    """CREATE TRIGGER IF NOT EXISTS users_tokens_changed_au
+    AFTER UPDATE OF token_version, is_active ON users
+    WHEN old.token_version IS NOT new.token_version OR old.is_active IS NOT new.is_active
+    BEGIN
+        UPDATE users SET tokens_changed_at = strftime('%Y-%m-%d %H:%M:%f000', 'now')
+        WHERE id = new.id;
+    END""",
+]
+
+POSTGRESQL_STATEMENTS = [
+    """CREATE OR REPLACE FUNCTION users_stamp_tokens_changed() RETURNS trigger AS $$
+    BEGIN
+        IF new.token_version IS DISTINCT FROM old.token_version
+                OR new.is_active IS DISTINCT FROM old.is_active THEN
+            new.tokens_changed_at := timezone('utc', now());
+        END IF;
+        RETURN new;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS users_tokens_changed_bu ON users",
+    """CREATE TRIGGER users_tokens_changed_bu
+    BEFORE UPDATE OF token_version, is_active ON users
+    FOR EACH ROW EXECUTE FUNCTION users_stamp_tokens_changed()""",
+]
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_STATEMENTS:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        for statement in POSTGRESQL_STATEMENTS:
+            op.execute(statement)
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS users_tokens_changed_au")
+    elif dialect == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS users_tokens_changed_bu ON users")
+        op.execute("DROP FUNCTION IF EXISTS users_stamp_tokens_changed()")
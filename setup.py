@@ -10,7 +10,9 @@ setup(
     install_requires=[
         "fastapi>=0.68.0",
         "uvicorn>=0.15.0",
-        "sqlalchemy>=1.4.0",
+        "sqlalchemy[asyncio]>=2.0.0",
+        "aiosqlite>=0.19.0",
+        "asyncpg>=0.28.0",
         "python-jose[cryptography]>=3.3.0",
         "passlib[bcrypt]>=1.7.4",
         "python-multipart>=0.0.5",
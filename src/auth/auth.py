@@ -1,14 +1,23 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from jose import JWTError, jwk, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..schemas.schemas import TokenData
+from ..schemas.schemas import User as UserSchema
 from ..models.models import User
-from ..database.database import get_db
+from ..database.database import get_async_db
+from ..cache.backends import create_backend
+from ..cache.lru import MISSING
+from ..metrics.registry import registry
+from .hashing import pwd_context, verify_and_update_password
+from .revocation import INACTIVE, REVOKED, revocations
+import hashlib
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,8 +27,23 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Кэш проверенных пользователей, чтобы не делать SELECT по users на каждый запрос
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+AUTH_DURATION = registry.histogram(
+    "auth_current_user_duration_seconds",
+    "Token validation and user lookup time per request",
+    ("cache",)
+)
+
+# Доля grant="password" показывает, сколько выдач еще платят за bcrypt
+TOKENS_ISSUED = registry.counter(
+    "auth_tokens_issued_total", "Access tokens issued by grant type", ("grant",)
+)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+user_cache = create_backend("users", maxsize=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL_SECONDS)
 
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
@@ -27,17 +51,38 @@ def verify_password(plain_password: str, hashed_password: str):
 def get_password_hash(password: str):
     return pwd_context.hash(password)
 
-def get_user(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user(db: AsyncSession, email: str):
+    result = await db.execute(select(User).filter(User.email == email))
+    return result.scalars().first()
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user(db, email)
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt выполняется в отдельном ограниченном пуле потоков, а не в event loop
+    verified, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash:
+        # Хеш создан со старыми параметрами — сохраняем пересчитанный
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
+@lru_cache(maxsize=None)
+def signing_key(secret: str, algorithm: str):
+    # Разобранный ключ: иначе jose заново разбирает строку ключа на каждый токен
+    return jwk.construct(secret, algorithm)
+
+def token_claims(user) -> dict:
+    # Все, что нужно для проверки запроса без обращения к базе
+    return {
+        "sub": user.email,
+        "uid": user.id,
+        "act": bool(user.is_active),
+        "ver": user.token_version or 0,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -45,27 +90,138 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, signing_key(SECRET_KEY, ALGORITHM), algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def client_key(scope) -> str:
+    # Ключ нужен лимитам, отметкам записи и выбору реплики в одном запросе,
+    # поэтому токен проверяется один раз, а результат хранится в состоянии
+    # запроса (request.state)
+    state = scope.setdefault("state", {})
+    key = state.get("client_key")
+    if key is None:
+        key = state["client_key"] = _client_key(scope)
+    return key
+
+def _client_key(scope) -> str:
+    # Клиент для лимитов и маршрутизации чтения: пользователь из действительного
+    # токена, иначе IP. Подпись проверяется, чтобы по чужому uid нельзя было
+    # исчерпать чужой лимит. За прокси IP берется из X-Forwarded-For средствами
+    # uvicorn (--proxy-headers)
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    claims = jwt.decode(
+                        token, signing_key(SECRET_KEY, ALGORITHM), algorithms=[ALGORITHM]
+                    )
+                except JWTError:
+                    break
+                user = claims.get("uid") or claims.get("sub")
+                if user is not None:
+                    return f"user:{user}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    started = time.perf_counter()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, signing_key(SECRET_KEY, ALGORITHM), algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, email=token_data.email)
-    if user is None:
+
+    user_id = payload.get("uid")
+    if user_id is not None:
+        # Основной путь: пользователь целиком описан подписанными claims,
+        # в базу идем только за обновлением списка отзыва раз в несколько секунд
+        if revocations.stale:
+            await revocations.refresh(db)
+        state = revocations.check(user_id, payload.get("ver", 0))
+        if state == REVOKED:
+            raise credentials_exception
+        AUTH_DURATION.observe(time.perf_counter() - started, "token")
+        # Claims подписаны нами и уже проверялись при выдаче токена, повторная
+        # валидация (проверка email) заняла бы больше времени, чем сама подпись
+        return UserSchema.model_construct(
+            id=user_id,
+            email=email,
+            is_active=bool(payload.get("act", True)) and state != INACTIVE
+        )
+
+    # Токены без uid, выданные до появления claims, проверяются по базе
+    # Ключ включает хеш самого токена, а срок действия токена уже проверен
+    # jwt.decode, поэтому запись из кэша не переживет истекший токен. Версия
+    # пользователя в ключе позволяет сбросить его записи во всех воркерах
+    namespace = f"user:{token_data.email}"
+    cache_key = "{}:{}@{}".format(
+        namespace,
+        hashlib.sha256(token.encode()).hexdigest()[:32],
+        *await user_cache.aversions(namespace)
+    )
+    principal = await user_cache.aget(cache_key)
+    if principal is not MISSING:
+        AUTH_DURATION.observe(time.perf_counter() - started, "hit")
+        return UserSchema(**principal)
+    user = await get_user(db, email=token_data.email)
+    # Такие токены соответствуют версии 0 и отзываются первым же выходом из системы
+    if user is None or user.token_version:
         raise credentials_exception
-    return user
+    principal = UserSchema.model_validate(user)
+    await user_cache.aset(cache_key, principal.model_dump())
+    AUTH_DURATION.observe(time.perf_counter() - started, "miss")
+    return principal
+
+async def invalidate_user(email: str) -> None:
+    await user_cache.abump(f"user:{email}")
+
+async def revoke_tokens(db: AsyncSession, user_id: int) -> None:
+    # Новая версия отзывает все токены пользователя; в этом воркере сразу,
+    # в остальных — при следующем обновлении списка отзыва (время изменения
+    # ставит триггер users_tokens_changed)
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.email, User.token_version, User.is_active)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    await db.commit()
+    if row is not None:
+        revocations.update(user_id, row.token_version, bool(row.is_active))
+        await invalidate_user(row.email)
+
+# Любое изменение или удаление пользователя через ORM сбрасывает его записи в кэше
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    emails = {target.email}
+    emails.update(inspect(target).attrs.email.history.deleted or ())
+    # Обработчик выполняется внутри flush асинхронной сессии, ждать записи в
+    # общий кэш здесь нельзя
+    user_cache.bump_soon(*(f"user:{email}" for email in emails))
+
+# Деактивация и удаление сразу видны проверке токенов в этом воркере
+@event.listens_for(User, "after_update")
+def _update_revocations(mapper, connection, target):
+    revocations.update(target.id, target.token_version or 0, bool(target.is_active))
+
+@event.listens_for(User, "after_delete")
+def _revoke_deleted_user(mapper, connection, target):
+    revocations.update(target.id, target.token_version or 0, False)
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from ..metrics.registry import registry
+
+load_dotenv()
+
+# Стоимость bcrypt. Хеши с меньшим числом раундов считаются устаревшими
+# и прозрачно перехешируются при следующем входе пользователя
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt отпускает GIL, поэтому потоков достаточно, процессы не нужны
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько операций может ждать свободного потока, прежде чем отвечать 429
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "16"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+
+HASH_DURATION = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hash and verify time", ("operation",)
+)
+HASH_QUEUE_WAIT = registry.histogram(
+    "password_hash_queue_seconds", "Time waiting for a free password hashing thread"
+)
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashingPool:
+    def __init__(self, workers: int, queue_depth: int):
+        self.capacity = workers + queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many authentication requests, try again later",
+                    headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+                )
+            self.in_flight += 1
+
+    def _release(self, elapsed: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.busy_seconds += elapsed
+
+    def _timed(self, func, submitted, *args):
+        started = time.perf_counter()
+        HASH_QUEUE_WAIT.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            HASH_DURATION.observe(elapsed, getattr(func, "__name__", "other"))
+            self._release(elapsed)
+
+    async def run(self, func, *args):
+        # Слот освобождается, когда поток закончил работу, даже если запрос
+        # уже отменен: иначе счетчик разошелся бы с реальной загрузкой пула
+        self._acquire()
+        try:
+            future = self._executor.submit(self._timed, func, time.perf_counter(), *args)
+        except BaseException:
+            self._release(0.0)
+            raise
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "busy_seconds": round(self.busy_seconds, 6),
+            }
+
+
+hashing_pool = HashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_DEPTH)
+
+
+async def hash_password(password: str) -> str:
+    return await hashing_pool.run(pwd_context.hash, password)
+
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    # Возвращает новый хеш, если сохраненный устарел (например, меньше раундов)
+    return await hashing_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..metrics.registry import registry
+from ..models.models import RefreshToken
+
+load_dotenv()
+
+# Срок жизни refresh-токена; access-токен при этом можно делать коротким
+# (ACCESS_TOKEN_EXPIRE_MINUTES), продление не требует пароля и bcrypt
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+REFRESH_REUSE = registry.counter(
+    "auth_refresh_token_reuse_total",
+    "Already rotated refresh tokens presented again (token family revoked)"
+)
+
+
+def hash_token(token: str) -> str:
+    # Токен — 256 случайных бит, поэтому достаточно быстрого SHA-256 без соли
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _invalid_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def issue_refresh_token(db: AsyncSession, user_id: int, family: Optional[str] = None) -> str:
+    # Запись добавляется в текущую транзакцию, коммит — за вызывающим
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_token(token),
+        family=family or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Tuple[int, str]:
+    # Токен обменивается одним условным UPDATE: из двух параллельных
+    # обменов одного токена пройдет только один
+    now = datetime.utcnow()
+    token_hash = hash_token(token)
+    result = await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now
+        )
+        .values(used_at=now)
+        .returning(RefreshToken.user_id, RefreshToken.family)
+        .execution_options(synchronize_session=False)
+    )
+    rotated = result.first()
+    if rotated is None:
+        await db.rollback()
+        result = await db.execute(
+            select(RefreshToken.family, RefreshToken.used_at, RefreshToken.revoked_at)
+            .where(RefreshToken.token_hash == token_hash)
+        )
+        stored = result.first()
+        if stored is not None and stored.used_at is not None and stored.revoked_at is None:
+            # Уже обмененный токен предъявлен снова: им пользуется кто-то еще.
+            # Отзываем всю цепочку, включая токен, выданный при обмене
+            await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.family == stored.family, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            REFRESH_REUSE.inc()
+        raise _invalid_token()
+    return rotated.user_id, issue_refresh_token(db, rotated.user_id, rotated.family)
+
+
+async def revoke_refresh_tokens(db: AsyncSession, user_id: int) -> None:
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def prune_refresh_tokens(db: Session) -> int:
+    # Обмененные и отозванные токены хранятся до истечения срока: по ним
+    # распознается повторное использование
+    result = db.execute(
+        delete(RefreshToken).where(RefreshToken.expires_at <= datetime.utcnow())
+    )
+    db.commit()
+    return result.rowcount
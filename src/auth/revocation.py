@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import User
+
+load_dotenv()
+
+# Как часто воркер перечитывает из базы версии токенов и деактивированных
+# пользователей (изменения, сделанные другими воркерами)
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "30"))
+# Отзыв нужен, только пока живут выданные до него токены доступа
+TOKEN_LIFETIME_SECONDS = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")) * 60
+
+REVOKED = "revoked"
+INACTIVE = "inactive"
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    # tokens_changed_at хранится в UTC без часового пояса
+    return value.replace(tzinfo=timezone.utc).timestamp() if value is not None else 0.0
+
+
+# Отзыв токенов по версиям: токен несет users.token_version на момент выдачи
+# и недействителен, если версия пользователя с тех пор выросла (выход из
+# системы). В памяти хранятся только пользователи, у которых версия или
+# активность менялись за время жизни токена доступа (users.tokens_changed_at),
+# — у остальных все действующие токены выданы после изменения и проверяются
+# одной подписью
+class RevocationList:
+    def __init__(
+        self,
+        refresh_seconds: float,
+        token_lifetime: float = TOKEN_LIFETIME_SECONDS,
+        timer: Callable[[], float] = time.monotonic,
+        clock: Callable[[], float] = time.time
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.token_lifetime = token_lifetime
+        self._timer = timer
+        # Время изменений сравнивается со временем из базы, поэтому часы не монотонные
+        self._clock = clock
+        # user_id -> (версия, активен, когда изменился)
+        self._entries: Dict[int, Tuple[int, bool, float]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    @property
+    def stale(self) -> bool:
+        return (
+            self._refreshed_at is None
+            or self._timer() - self._refreshed_at >= self.refresh_seconds
+        )
+
+    def check(self, user_id: int, version: int) -> Optional[str]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        current_version, active, _ = entry
+        if version < current_version:
+            return REVOKED
+        return None if active else INACTIVE
+
+    def update(self, user_id: int, version: int, active: bool) -> None:
+        with self._lock:
+            previous = self._entries.get(user_id)
+            if previous is None:
+                if version == 0 and active:
+                    return
+                previous = (0, True, 0.0)
+            version = max(version, previous[0])
+            if (version, active) != previous[:2]:
+                self._entries[user_id] = (version, active, self._clock())
+
+    async def refresh(self, db: AsyncSession) -> None:
+        # Отметка ставится до запроса, чтобы параллельные запросы не перечитывали
+        # список одновременно
+        self._refreshed_at = self._timer()
+        cutoff = self._clock() - self.token_lifetime
+        result = await db.execute(
+            select(User.id, User.token_version, User.is_active, User.tokens_changed_at)
+            .where(User.tokens_changed_at >= datetime.utcfromtimestamp(cutoff))
+        )
+        loaded = {
+            user_id: (version, bool(active), _timestamp(changed_at))
+            for user_id, version, active, changed_at in result.all()
+        }
+        with self._lock:
+            # Объединяем с тем, что уже известно воркеру: отзыв, сделанный во
+            # время чтения, и удаленные пользователи (их строк в базе уже нет)
+            # не должны потеряться. Версии только растут
+            entries = dict(self._entries)
+            for user_id, (version, active, changed_at) in loaded.items():
+                previous = entries.get(user_id, (0, True, 0.0))
+                # Активность берется из более позднего изменения
+                if previous[2] > changed_at:
+                    active = previous[1]
+                entries[user_id] = (
+                    max(version, previous[0]), active, max(changed_at, previous[2])
+                )
+            # Изменения старше времени жизни токена больше ничего не отзывают
+            self._entries = {
+                user_id: entry for user_id, entry in entries.items() if entry[2] >= cutoff
+            }
+            self.refreshes += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._refreshed_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "refresh_seconds": self.refresh_seconds,
+            "refreshes": self.refreshes,
+        }
+
+
+revocations = RevocationList(REVOCATION_REFRESH_SECONDS)
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from .lru import MISSING, TTLCache
+
+load_dotenv()
+
+# memory — кэш внутри процесса; sqlite — общий файл для всех воркеров на хосте
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "cache.db")
+CACHE_SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("CACHE_SQLITE_BUSY_TIMEOUT_MS", "1000"))
+# Как часто (раз в сколько записей) общий кэш чистится от просроченных и лишних строк
+CACHE_SQLITE_PRUNE_EVERY = int(os.getenv("CACHE_SQLITE_PRUNE_EVERY", "200"))
+
+# Все бэкенды хранят только JSON-совместимые значения, чтобы запись, сделанная
+# одним воркером, читалась любым другим.
+#
+# Инвалидация построена на версиях: ключ записи включает текущие версии своих
+# пространств имен (versions), а изменение данных увеличивает версию (bump).
+# Старые записи становятся недостижимы во всех воркерах сразу и вытесняются по
+# TTL. Версии читаются до запроса к базе, поэтому ответ, прочитанный до
+# изменения, сохраняется под уже устаревшим ключом и никому не отдается
+
+
+# Асинхронные варианты методов для обработчиков и middleware. SQLite-бэкенд
+# блокирует поток (запись ждет блокировку файла до busy timeout), поэтому из
+# event loop он вызывается в пуле потоков; кэш в памяти отвечает сразу
+class AsyncMethods:
+    blocking = False
+
+    async def _call(self, function: Callable, *args: Any) -> Any:
+        if self.blocking:
+            return await run_in_threadpool(function, *args)
+        return function(*args)
+
+    async def aget(self, key: str, default: Any = MISSING) -> Any:
+        return await self._call(self.get, key, default)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._call(self.set, key, value, ttl)
+
+    async def aversions(self, *namespaces: str) -> Tuple[int, ...]:
+        return await self._call(self.versions, *namespaces)
+
+    async def abump(self, *namespaces: str) -> None:
+        await self._call(self.bump, *namespaces)
+
+    def bump_soon(self, *namespaces: str) -> None:
+        # Для синхронного кода, который может выполняться внутри event loop
+        # (события ORM асинхронной сессии): запись уходит в пул потоков без ожидания
+        if self.blocking:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                loop.run_in_executor(None, self.bump, *namespaces)
+                return
+        self.bump(*namespaces)
+
+
+class MemoryBackend(AsyncMethods, TTLCache):
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        maxbytes: int = 0,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        super().__init__(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes, sizeof=sizeof)
+        self._versions: Dict[str, int] = {}
+
+    def versions(self, *namespaces: str) -> Tuple[int, ...]:
+        return tuple(self._versions.get(namespace, 0) for namespace in namespaces)
+
+    def bump(self, *namespaces: str) -> None:
+        with self._lock:
+            for namespace in namespaces:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **super().stats()}
+
+
+class SQLiteBackend(AsyncMethods):
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        maxsize: int,
+        ttl: float,
+        maxbytes: int = 0,
+        timer: Callable[[], float] = time.time
+    ):
+        self.path = path
+        self.table = table
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        # Время сравнивается между процессами, поэтому часы не монотонные
+        self._timer = timer
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Отдельное соединение на поток: sqlite3 не разрешает делить его между потоками
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=CACHE_SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table}_versions ("
+                "namespace TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        row = self._connection().execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?",
+            (key, self._timer())
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        if self.maxbytes and len(data) > self.maxbytes:
+            return
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+        connection = self._connection()
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, size) "
+            "VALUES (?, ?, ?, ?)",
+            (key, data, expires_at, len(data))
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % CACHE_SQLITE_PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        # Удаляем просроченные записи, а затем самые старые сверх maxsize/maxbytes
+        connection = self._connection()
+        removed = connection.execute(
+            f"DELETE FROM {self.table} WHERE expires_at <= ?", (self._timer(),)
+        ).rowcount
+        removed += connection.execute(
+            f"""DELETE FROM {self.table} WHERE key IN (
+                SELECT key FROM (
+                    SELECT key,
+                           ROW_NUMBER() OVER recent AS position,
+                           SUM(size) OVER recent AS total
+                    FROM {self.table}
+                    WINDOW recent AS (ORDER BY expires_at DESC)
+                )
+                WHERE position > ? OR (? > 0 AND total > ?)
+            )""",
+            (self.maxsize, self.maxbytes, self.maxbytes)
+        ).rowcount
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def delete(self, key: str) -> None:
+        self._connection().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def versions(self, *namespaces: str) -> Tuple[int, ...]:
+        placeholders = ", ".join("?" for _ in namespaces)
+        rows = dict(self._connection().execute(
+            f"SELECT namespace, version FROM {self.table}_versions "
+            f"WHERE namespace IN ({placeholders})",
+            namespaces
+        ).fetchall())
+        return tuple(rows.get(namespace, 0) for namespace in namespaces)
+
+    def bump(self, *namespaces: str) -> None:
+        self._connection().executemany(
+            f"INSERT INTO {self.table}_versions (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT (namespace) DO UPDATE SET version = version + 1",
+            [(namespace,) for namespace in namespaces]
+        )
+
+    def clear(self) -> None:
+        # Версии не сбрасываются: иначе ключи, записанные до очистки, снова стали бы актуальными
+        self._connection().execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> Dict[str, Any]:
+        size, total = self._connection().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": "sqlite",
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+        if self.maxbytes:
+            stats["bytes"] = total
+            stats["maxbytes"] = self.maxbytes
+        return stats
+
+
+def create_backend(
+    name: str,
+    maxsize: int,
+    ttl: float,
+    maxbytes: int = 0,
+    sizeof: Optional[Callable[[Any], int]] = None
+):
+    if CACHE_BACKEND == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes, sizeof=sizeof)
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(
+            CACHE_SQLITE_PATH, table=f"cache_{name}", maxsize=maxsize, ttl=ttl, maxbytes=maxbytes
+        )
+    raise ValueError(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}', expected memory or sqlite")
@@ -0,0 +1,179 @@
+import hashlib
+import os
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlencode
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from ..database.database import REPLICA_STICKY_SECONDS
+from .backends import create_backend
+from .lru import MISSING
+from .singleflight import SingleFlight
+
+load_dotenv()
+
+# Кэш готовых ответов каталога: сколько хранить на сервере и сколько разрешать
+# хранить клиентам и прокси (Cache-Control: max-age)
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "30"))
+# Сколько недавно измененных пространств имен помнит кэш (см. ResponseCache.settled)
+RESPONSE_CACHE_MAX_CHANGES = int(os.getenv("RESPONSE_CACHE_MAX_CHANGES", "100000"))
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers", "shared")
+
+    def __init__(
+        self,
+        body: bytes,
+        etag: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        shared: bool = True
+    ):
+        self.body = body
+        # Сильный ETag: меняется при любом изменении тела ответа
+        self.etag = etag or '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.headers = headers or {}
+        # False — ответ мог устареть (прочитан с реплики сразу после изменения):
+        # он не сохраняется в кэше и не кэшируется клиентами и прокси
+        self.shared = shared
+
+    def dump(self) -> list:
+        return [self.body.decode("utf-8"), self.etag, self.headers]
+
+    @classmethod
+    def load(cls, data: list) -> "CachedResponse":
+        body, etag, headers = data
+        return cls(body.encode("utf-8"), etag, headers)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Для If-None-Match используется слабое сравнение, поэтому W/ отбрасывается
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(
+        (tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates
+    )
+
+
+class ResponseCache:
+    def __init__(self, backend, max_age: int, changes=None):
+        self.backend = backend
+        self.max_age = max_age
+        # Пространства имен, измененные недавно (записи живут, пока реплики
+        # могут отставать)
+        self.changes = changes
+
+    async def key(self, key: str, *namespaces: str) -> str:
+        # Версии читаются до запроса к базе: если данные изменятся во время
+        # запроса, ответ сохранится под устаревшим ключом
+        versions = await self.backend.aversions(*namespaces)
+        return key + "@" + ".".join(str(version) for version in versions)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        data = await self.backend.aget(key)
+        return None if data is MISSING else CachedResponse.load(data)
+
+    async def put(
+        self,
+        key: str,
+        content: Any,
+        headers: Optional[Dict[str, str]] = None,
+        shared: bool = True
+    ) -> CachedResponse:
+        # Уже закодированное тело (быстрый режим списков) сохраняется как есть
+        if not isinstance(content, bytes):
+            content = JSONResponse(jsonable_encoder(content)).body
+        entry = CachedResponse(content, headers=headers, shared=shared)
+        if shared:
+            await self.backend.aset(key, entry.dump())
+        return entry
+
+    async def invalidate(self, *namespaces: str) -> None:
+        await self.backend.abump(*namespaces)
+        if self.changes is not None:
+            for namespace in namespaces:
+                await self.changes.aset(namespace, 1)
+
+    async def settled(self, *namespaces: str) -> bool:
+        # Ни одно из пространств имен не менялось последние REPLICA_STICKY_SECONDS:
+        # реплики успели получить изменения, и прочитанное с них можно кэшировать
+        if self.changes is None:
+            return True
+        for namespace in namespaces:
+            if await self.changes.aget(namespace) is not MISSING:
+                return False
+        return True
+
+    def clear(self) -> None:
+        self.backend.clear()
+        if self.changes is not None:
+            self.changes.clear()
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        headers = {
+            **entry.headers,
+            "ETag": entry.etag,
+            "Cache-Control": (
+                f"public, max-age={self.max_age}"
+                if self.max_age > 0 and entry.shared else "no-cache"
+            ),
+        }
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+catalog_cache = ResponseCache(
+    create_backend(
+        "catalog",
+        maxsize=RESPONSE_CACHE_MAX_ENTRIES,
+        ttl=RESPONSE_CACHE_TTL_SECONDS,
+        maxbytes=RESPONSE_CACHE_MAX_BYTES,
+        sizeof=lambda data: len(data[0])
+    ),
+    max_age=RESPONSE_CACHE_MAX_AGE,
+    changes=create_backend(
+        "catalog_changes", maxsize=RESPONSE_CACHE_MAX_CHANGES, ttl=REPLICA_STICKY_SECONDS
+    )
+)
+# Промахи кэша каталога с одинаковым ключом читают базу один раз на все
+# параллельные запросы (ключ уже содержит параметры запроса и версии)
+catalog_flight = SingleFlight("catalog")
+
+
+# Пространства имен версий каталога: "books" — все страницы списка,
+# "book:<id>" — карточка книги, "catalog" — все карточки сразу
+BOOKS_NAMESPACES = ("books",)
+
+
+def book_namespaces(book_id: int) -> tuple:
+    return ("catalog", f"book:{book_id}")
+
+
+async def book_key(book_id: int, fields: Optional[List[str]] = None) -> str:
+    key = f"book:{book_id}" + (f"?fields={','.join(fields)}" if fields else "")
+    return await catalog_cache.key(key, *book_namespaces(book_id))
+
+
+async def books_key(params: Iterable) -> str:
+    return await catalog_cache.key(f"books:{urlencode(sorted(params))}", *BOOKS_NAMESPACES)
+
+
+async def invalidate_books(book_ids: Optional[Iterable[int]] = None) -> None:
+    # Любое изменение книги может изменить любую страницу списка, поэтому списки
+    # сбрасываются всегда, а карточки — только измененных книг (или все, если
+    # список не передан)
+    if book_ids is None:
+        await catalog_cache.invalidate("books", "catalog")
+    else:
+        await catalog_cache.invalidate("books", *(f"book:{book_id}" for book_id in set(book_ids)))
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from ..metrics.registry import registry
+
+SINGLEFLIGHT_CALLS = registry.counter(
+    "singleflight_calls_total",
+    "Reads that ran the query (leader) or waited for an identical one in flight (coalesced)",
+    ("name", "role")
+)
+
+
+class _LeaderCancelled(Exception):
+    pass
+
+
+# Объединение одинаковых запросов: пока по ключу выполняется загрузка, другие
+# запросы с тем же ключом ждут ее результат (или исключение, например 404),
+# а не выполняют тот же SELECT. Ключ должен включать все параметры запроса и
+# версии кэша: после изменения данных новые запросы получают новый ключ и не
+# присоединяются к чтению, начатому до изменения
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            SINGLEFLIGHT_CALLS.inc(self.name, "coalesced")
+            try:
+                # shield: отмена одного ожидающего не отменяет общую загрузку
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # Запрос-лидер отменен (клиент отключился), загрузка и его сессия
+                # прерваны — следующий ожидающий становится лидером
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        SINGLEFLIGHT_CALLS.inc(self.name, "leader")
+        try:
+            result = await load()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Помечаем исключение полученным, если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
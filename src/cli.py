@@ -0,0 +1,87 @@
+import argparse
+import json
+import sys
+
+from .auth.refresh import prune_refresh_tokens
+from .database.database import SessionLocal
+from .services import catalog_io, loans
+
+
+def import_books_command(args) -> int:
+    file_format = args.format or catalog_io.detect_format(args.path, None)
+    if file_format is None:
+        print("Cannot detect file format, pass --format csv|ndjson", file=sys.stderr)
+        return 2
+    with open(args.path, "rb") as source, SessionLocal() as db:
+        report = catalog_io.import_books(db, source, file_format, args.batch_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["failed"] == 0 else 1
+
+
+def export_books_command(args) -> int:
+    with open(args.path, "w", encoding="utf-8", newline="") as target, SessionLocal() as db:
+        target.write(catalog_io.export_header(args.format))
+        result = db.execute(
+            catalog_io.export_statement().execution_options(
+                yield_per=catalog_io.EXPORT_CHUNK_SIZE
+            )
+        )
+        for rows in result.partitions():
+            target.write(catalog_io.export_chunk(rows, args.format))
+    return 0
+
+
+def check_loans_command(args) -> int:
+    with SessionLocal() as db:
+        mismatches = loans.find_mismatches(db)
+        for mismatch in mismatches:
+            print(json.dumps(mismatch))
+        if mismatches and args.repair:
+            repaired = loans.repair_counters(db)
+            print(f"Repaired {repaired} reader counters", file=sys.stderr)
+            return 0
+    print(f"{len(mismatches)} reader counters out of sync", file=sys.stderr)
+    return 1 if mismatches else 0
+
+
+def prune_tokens_command(args) -> int:
+    with SessionLocal() as db:
+        removed = prune_refresh_tokens(db)
+    print(f"Removed {removed} expired refresh tokens", file=sys.stderr)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Library API utilities")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-books", help="Bulk import books from CSV/NDJSON")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=catalog_io.FORMATS)
+    import_parser.add_argument("--batch-size", type=int, default=catalog_io.IMPORT_BATCH_SIZE)
+    import_parser.set_defaults(handler=import_books_command)
+
+    export_parser = commands.add_parser("export-books", help="Export books to CSV/NDJSON")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=catalog_io.FORMATS, default="ndjson")
+    export_parser.set_defaults(handler=export_books_command)
+
+    loans_parser = commands.add_parser(
+        "check-loans", help="Compare readers.active_loans with unreturned borrowed_books"
+    )
+    loans_parser.add_argument(
+        "--repair", action="store_true", help="Recalculate counters that are out of sync"
+    )
+    loans_parser.set_defaults(handler=check_loans_command)
+
+    prune_parser = commands.add_parser(
+        "prune-refresh-tokens", help="Delete expired refresh tokens"
+    )
+    prune_parser.set_defaults(handler=prune_tokens_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,92 @@
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
+from .pool import engine_options, install_sqlite_pragmas, pool_statistics
+from ..metrics.database import install_query_metrics
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///library.db")
 
-# Для SQLite нужно добавить check_same_thread=False
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+# Асинхронные драйверы для диалектов, которые поддерживает приложение
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+SYNC_DRIVERS = {
+    "sqlite": "pysqlite",
+    "postgresql": "psycopg2",
+}
+
+
+def _with_driver(url: str, drivers: dict) -> str:
+    parsed = make_url(url)
+    driver = drivers.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+# DATABASE_URL может указывать как синхронный, так и асинхронный драйвер:
+# второй URL получается из первого заменой драйвера
+SYNC_DATABASE_URL = _with_driver(SQLALCHEMY_DATABASE_URL, SYNC_DRIVERS)
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL", _with_driver(SQLALCHEMY_DATABASE_URL, ASYNC_DRIVERS)
 )
+
+# Параметры пула и PRAGMA для SQLite задаются переменными окружения (см. pool.py)
+engine = create_engine(SYNC_DATABASE_URL, **engine_options(SYNC_DATABASE_URL))
+install_sqlite_pragmas(engine)
+install_query_metrics(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок используется обработчиками запросов, синхронный — миграциями,
+# созданием таблиц и утилитами командной строки
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True)
+)
+install_sqlite_pragmas(async_engine)
+install_query_metrics(async_engine, "async")
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Реплики только для чтения (через запятую). Обработчики списков и карточек
+# читают с них по очереди, запись всегда идет в основную базу
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+# Сколько секунд после записи данные считаются недошедшими до реплик: столько
+# клиент читает основную базу, а кэш каталога не заполняется с реплик. Должно
+# быть больше отставания реплик
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+
+def replica_sessionmaker(replica_engine):
+    # Сессии реплик помечены в info: прочитанное с них не должно попадать
+    # в кэш, пока реплики могут отставать
+    return async_sessionmaker(
+        replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+        info={"replica": True}
+    )
+
+
+replica_engines = []
+for number, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    url = _with_driver(url, ASYNC_DRIVERS)
+    replica_engine = create_async_engine(url, **engine_options(url, is_async=True))
+    install_sqlite_pragmas(replica_engine)
+    install_query_metrics(replica_engine, f"replica-{number}")
+    replica_engines.append(replica_engine)
+ReplicaSessionLocals = [replica_sessionmaker(replica_engine) for replica_engine in replica_engines]
+
 Base = declarative_base()
 
 def get_db():
@@ -23,3 +95,30 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Фабрика сессий отдельной зависимостью: потоковые ответы открывают собственную
+# сессию, потому что сессия из get_async_db закрывается до отправки тела ответа
+def get_session_factory():
+    return AsyncSessionLocal
+
+# Отдельной зависимостью, чтобы тесты могли подставить свои реплики
+def get_replica_session_factories():
+    return ReplicaSessionLocals
+
+async def get_async_db(session_factory=Depends(get_session_factory)):
+    async with session_factory() as db:
+        try:
+            yield db
+        except Exception:
+            # Не возвращаем в пул соединение с незавершенной транзакцией
+            await db.rollback()
+            raise
+
+def get_pool_statistics() -> dict:
+    statistics = {
+        "async": pool_statistics(async_engine),
+        "sync": pool_statistics(engine),
+    }
+    for number, replica_engine in enumerate(replica_engines, start=1):
+        statistics[f"replica-{number}"] = pool_statistics(replica_engine)
+    return statistics
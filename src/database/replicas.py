@@ -0,0 +1,90 @@
+import itertools
+import os
+
+from dotenv import load_dotenv
+from fastapi import Depends, Request
+
+from ..auth.auth import client_key
+from ..cache.backends import create_backend
+from ..cache.lru import MISSING
+from ..metrics.registry import registry
+from .database import (
+    REPLICA_STICKY_SECONDS, get_replica_session_factories, get_session_factory
+)
+
+load_dotenv()
+
+REPLICA_STICKY_MAX_CLIENTS = int(os.getenv("REPLICA_STICKY_MAX_CLIENTS", "100000"))
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+READS = registry.counter(
+    "db_read_routing_total", "Read-only handlers by database they were routed to", ("target",)
+)
+
+# Клиенты, недавно выполнившие запись. Хранятся в CACHE_BACKEND: с sqlite
+# отметка видна всем воркерам хоста, и чтение после записи попадает в основную
+# базу, даже если его обслуживает другой воркер
+recent_writes = create_backend(
+    "recent_writes", maxsize=REPLICA_STICKY_MAX_CLIENTS, ttl=REPLICA_STICKY_SECONDS
+)
+_next_replica = itertools.count()
+
+
+async def sticky_reads(
+    request: Request, replicas=Depends(get_replica_session_factories)
+) -> bool:
+    # Read-your-writes: клиент, который только что писал, не должен получить
+    # с отстающей реплики данные без своего изменения
+    if not replicas:
+        return False
+    return await recent_writes.aget(client_key(request.scope)) is not MISSING
+
+
+def get_read_session_factory(
+    primary=Depends(get_session_factory),
+    replicas=Depends(get_replica_session_factories),
+    sticky: bool = Depends(sticky_reads)
+):
+    if not replicas or sticky:
+        READS.inc("primary")
+        return primary
+    READS.inc("replica")
+    return replicas[next(_next_replica) % len(replicas)]
+
+
+async def get_read_db(session_factory=Depends(get_read_session_factory)):
+    async with session_factory() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+# Отмечает клиента после успешного изменяющего запроса. Решение принимается по
+# методу и статусу ответа, а не по сессии, поэтому новые обработчики записи
+# учитываются без изменений
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Без реплик все читают основную базу, и отметка была бы лишней записью
+        # в CACHE_BACKEND на каждый изменяющий запрос
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or not get_replica_session_factories()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_mark(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                # Отметка ставится до отправки ответа: следующий запрос клиента
+                # уже увидит ее
+                await recent_writes.aset(client_key(scope), 1)
+            await send(message)
+
+        await self.app(scope, receive, send_and_mark)
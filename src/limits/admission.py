@@ -0,0 +1,90 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Сколько дорогих операций каждого вида выполняется одновременно (0 — без
+# ограничения). Сверх лимита запрос сразу получает 503, а не ждет в очереди
+# до таймаута, занимая соединение с базой или поток bcrypt
+ADMISSION_LOGIN_CONCURRENCY = int(os.getenv("ADMISSION_LOGIN_CONCURRENCY", "32"))
+ADMISSION_BULK_CONCURRENCY = int(os.getenv("ADMISSION_BULK_CONCURRENCY", "4"))
+# Список считается тяжелым, если limit больше этого значения или ответ потоковый
+ADMISSION_BULK_LIMIT = int(os.getenv("ADMISSION_BULK_LIMIT", "1000"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+LOGIN = "login"
+BULK = "bulk"
+
+LOGIN_PATHS = {"/token", "/register"}
+BULK_PATHS = {
+    "/books/books/import",
+    "/books/books/export",
+    "/borrowed-books/borrow/bulk/",
+    "/borrowed-books/return/bulk/",
+}
+
+
+def classify(method: str, path: str, query_string: bytes) -> Optional[str]:
+    # Вид дорогой операции по методу, пути и параметрам или None для обычного запроса.
+    # Вызывается до роутинга, поэтому шаблон маршрута еще неизвестен
+    if method == "POST" and path in LOGIN_PATHS:
+        return LOGIN
+    if path in BULK_PATHS:
+        return BULK
+    if method == "GET" and (b"limit=" in query_string or b"stream=" in query_string):
+        params = parse_qs(query_string.decode("latin-1"))
+        if "stream" in params:
+            return BULK
+        # Все, что не положительное целое в пределах лимита (-5, 1e9, ...), тоже
+        # тяжелое: такие значения могут обойти ограничение размера выборки
+        limit = params.get("limit", ["1"])[-1]
+        if not (limit.isascii() and limit.isdigit()) or not 0 < int(limit) <= ADMISSION_BULK_LIMIT:
+            return BULK
+    return None
+
+
+class AdmissionControl:
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = limits
+        self._lock = threading.Lock()
+        self.in_flight = {name: 0 for name in limits}
+        self.rejected = {name: 0 for name in limits}
+
+    def try_acquire(self, operation: str) -> bool:
+        limit = self.limits.get(operation, 0)
+        with self._lock:
+            if limit and self.in_flight[operation] >= limit:
+                self.rejected[operation] += 1
+                return False
+            self.in_flight[operation] = self.in_flight.get(operation, 0) + 1
+            return True
+
+    def release(self, operation: str) -> None:
+        with self._lock:
+            self.in_flight[operation] -= 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.in_flight = {name: 0 for name in self.limits}
+            self.rejected = {name: 0 for name in self.limits}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    "limit": limit,
+                    "in_flight": self.in_flight[name],
+                    "rejected": self.rejected[name],
+                }
+                for name, limit in self.limits.items()
+            }
+
+
+admission = AdmissionControl({
+    LOGIN: ADMISSION_LOGIN_CONCURRENCY,
+    BULK: ADMISSION_BULK_CONCURRENCY,
+})
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+# memory — корзины внутри процесса (у каждого воркера свой лимит);
+# sqlite — общий файл, лимит действует на все воркеры хоста вместе
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "ratelimit.db")
+RATE_LIMIT_SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("RATE_LIMIT_SQLITE_BUSY_TIMEOUT_MS", "1000"))
+# Сколько клиентов помнит память. Вытесняются давно не обращавшиеся: их корзины
+# почти наверняка уже полные
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Строки общего файла, не менявшиеся дольше этого времени, удаляются: за это
+# время любая корзина успевает наполниться
+RATE_LIMIT_SQLITE_IDLE_SECONDS = float(os.getenv("RATE_LIMIT_SQLITE_IDLE_SECONDS", "3600"))
+RATE_LIMIT_SQLITE_PRUNE_EVERY = int(os.getenv("RATE_LIMIT_SQLITE_PRUNE_EVERY", "1000"))
+
+
+def take_token(
+    tokens: float, updated_at: float, now: float, rate: float, burst: float, cost: float
+) -> Tuple[float, float]:
+    # Token bucket: корзина пополняется на rate токенов в секунду, но не больше
+    # burst. Возвращает новый остаток и время ожидания (0 — запрос разрешен)
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBuckets:
+    def __init__(self, maxsize: int, timer: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self._timer = timer
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = self._timer()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens, wait = take_token(tokens, updated_at, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def atake(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        return self.take(key, rate, burst, cost)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self._buckets), "max_keys": self.maxsize}
+
+
+# Чтение и обновление корзины — один UPSERT: блокировка записи держится только
+# на время оператора. SET вычисляется по значениям строки до обновления, так что
+# пополнение и списание повторяют take_token
+_REFILL = "MIN(:burst, tokens + MAX(0.0, :now - updated_at) * :rate)"
+_TAKE_SQL = f"""
+    INSERT INTO rate_limit_buckets (key, tokens, updated_at, wait)
+    VALUES (:key, :tokens, :now, :wait)
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = CASE WHEN {_REFILL} >= :cost THEN {_REFILL} - :cost ELSE {_REFILL} END,
+        wait = CASE WHEN {_REFILL} >= :cost THEN 0.0 ELSE (:cost - {_REFILL}) / :rate END,
+        updated_at = :now
+    RETURNING wait
+"""
+
+
+class SQLiteBuckets:
+    def __init__(self, path: str, timer: Callable[[], float] = time.time):
+        self.path = path
+        # Время сравнивается между процессами, поэтому часы не монотонные
+        self._timer = timer
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Отдельное соединение на поток: sqlite3 не разрешает делить его между потоками
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=RATE_LIMIT_SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # wait — ответ последнего take (0 — запрос разрешен): RETURNING видит
+            # только новую строку, а по остатку токенов отказ не отличить от успеха
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, "
+                "wait REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        # Новая корзина считается в Python, существующая — в самом UPSERT
+        now = self._timer()
+        tokens, wait = take_token(burst, now, now, rate, burst, cost)
+        wait = self._connection().execute(
+            _TAKE_SQL,
+            {
+                "key": key, "tokens": tokens, "wait": wait, "now": now,
+                "rate": rate, "burst": burst, "cost": cost,
+            }
+        ).fetchall()[0][0]
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % RATE_LIMIT_SQLITE_PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return wait
+
+    async def atake(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        # Запись ждет блокировку файла до busy timeout, поэтому не в event loop
+        return await run_in_threadpool(self.take, key, rate, burst, cost)
+
+    def prune(self) -> int:
+        return self._connection().execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at < ?",
+            (self._timer() - RATE_LIMIT_SQLITE_IDLE_SECONDS,)
+        ).rowcount
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM rate_limit_buckets")
+
+    def stats(self) -> Dict[str, Any]:
+        keys = self._connection().execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+        return {"backend": "sqlite", "keys": keys}
+
+
+def create_buckets(backend: Optional[str] = None):
+    backend = backend or RATE_LIMIT_BACKEND
+    if backend == "memory":
+        return MemoryBuckets(RATE_LIMIT_MAX_KEYS)
+    if backend == "sqlite":
+        return SQLiteBuckets(RATE_LIMIT_SQLITE_PATH)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}', expected memory or sqlite")
+
+
+buckets = create_buckets()
@@ -0,0 +1,106 @@
+import math
+import os
+from typing import NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+
+from ..auth.auth import client_key
+from ..metrics.registry import registry
+from .admission import ADMISSION_RETRY_AFTER, BULK, LOGIN, admission, classify
+from .buckets import buckets
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Лимиты в формате "<число>/<second|minute|hour>"; число одновременно задает
+# размер всплеска. Пустое значение или 0 отключает правило
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "100/second")
+RATE_LIMIT_LOGIN = os.getenv("RATE_LIMIT_LOGIN", "10/minute")
+RATE_LIMIT_BULK = os.getenv("RATE_LIMIT_BULK", "30/minute")
+# Сбор метрик не должен упираться в лимит клиента
+RATE_LIMIT_EXEMPT_PATHS = {"/metrics"}
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+REJECTED = registry.counter(
+    "http_requests_rejected_total",
+    "Requests rejected by rate limits (429) and admission control (503)",
+    ("reason", "rule")
+)
+
+
+class RateRule(NamedTuple):
+    name: str
+    # Токенов в секунду и емкость корзины
+    rate: float
+    burst: float
+    # Вид операции из admission.classify; None — правило для всех запросов
+    operation: Optional[str] = None
+
+
+def parse_rate(value: str) -> Tuple[float, float]:
+    if not value or value == "0":
+        return 0.0, 0.0
+    count, _, period = value.partition("/")
+    if period not in PERIODS:
+        raise ValueError(f"Invalid rate limit '{value}', expected <count>/<second|minute|hour>")
+    return float(count) / PERIODS[period], float(count)
+
+
+RULES = [
+    RateRule("login", *parse_rate(RATE_LIMIT_LOGIN), operation=LOGIN),
+    RateRule("bulk", *parse_rate(RATE_LIMIT_BULK), operation=BULK),
+    RateRule("default", *parse_rate(RATE_LIMIT_DEFAULT)),
+]
+
+
+async def reject(scope, receive, send, status_code: int, detail: str, retry_after: int):
+    response = JSONResponse(
+        {"detail": detail}, status_code=status_code, headers={"Retry-After": str(retry_after)}
+    )
+    await response(scope, receive, send)
+
+
+# Token bucket на клиента (пользователь или IP) и вид операции, затем
+# ограничение числа одновременных дорогих операций. Оба отказа отдаются сразу
+# с Retry-After: 429 — превышен лимит клиента, 503 — сервер занят
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in RATE_LIMIT_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        operation = classify(scope["method"], scope["path"], scope["query_string"])
+        if RATE_LIMIT_ENABLED:
+            client = client_key(scope)
+            for rule in RULES:
+                if not rule.rate or rule.operation not in (None, operation):
+                    continue
+                wait = await buckets.atake(f"{rule.name}:{client}", rule.rate, rule.burst)
+                if wait:
+                    REJECTED.inc("rate_limit", rule.name)
+                    await reject(
+                        scope, receive, send, 429, "Rate limit exceeded, try again later",
+                        max(1, math.ceil(wait))
+                    )
+                    return
+
+        if operation is None:
+            await self.app(scope, receive, send)
+            return
+        if not admission.try_acquire(operation):
+            REJECTED.inc("admission", operation)
+            await reject(
+                scope, receive, send, 503, "Server is busy, try again later",
+                ADMISSION_RETRY_AFTER
+            )
+            return
+        # Слот держится до конца ответа, включая потоковую отдачу
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(operation)
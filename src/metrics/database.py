@@ -0,0 +1,53 @@
+import time
+from contextvars import ContextVar, Token
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+from .profiling import record_query
+from .registry import registry
+
+QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Duration of SQL statements", ("engine",)
+)
+
+# Счетчик запросов текущего HTTP-запроса: [количество, суммарное время].
+# Список общий для всех задач и потоков, унаследовавших контекст запроса
+_request_queries: ContextVar[Optional[List]] = ContextVar("request_queries", default=None)
+
+
+def start_request() -> Tuple[List, Token]:
+    queries = [0, 0.0]
+    return queries, _request_queries.set(queries)
+
+
+def finish_request(token: Token) -> None:
+    _request_queries.reset(token)
+
+
+def install_query_metrics(engine, name: str) -> None:
+    # События висят на синхронном движке: асинхронный движок выполняет
+    # запросы через него же
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        elapsed = time.perf_counter() - started
+        QUERY_DURATION.observe(elapsed, name)
+        record_query(statement, parameters, started, elapsed)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        # Запрос с ошибкой не доходит до after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
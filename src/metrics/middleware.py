@@ -0,0 +1,64 @@
+import time
+
+from .database import finish_request, start_request
+from .registry import COUNT_BUCKETS, registry
+
+REQUESTS = registry.counter(
+    "http_requests_total",
+    "HTTP requests by route template and status",
+    ("method", "route", "status")
+)
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP request duration", ("method", "route")
+)
+IN_FLIGHT = registry.gauge("http_requests_in_flight", "HTTP requests being processed")
+REQUEST_QUERIES = registry.histogram(
+    "http_request_db_queries",
+    "SQL statements per HTTP request",
+    ("method", "route"),
+    COUNT_BUCKETS
+)
+REQUEST_DB_DURATION = registry.histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL per HTTP request", ("method", "route")
+)
+
+# Запросы, не совпавшие ни с одним маршрутом, сводятся в одну метку, чтобы
+# произвольные URL не раздували число временных рядов
+UNMATCHED_ROUTE = "unmatched"
+
+
+# Чистый ASGI-middleware: не оборачивает запрос и ответ в объекты Starlette
+# и не мешает потоковой отдаче
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        queries, token = start_request()
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec()
+            finish_request(token)
+            # Шаблон маршрута ("/books/books/{book_id}") становится известен после роутинга
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            REQUESTS.inc(method, route, str(status_code))
+            REQUEST_DURATION.observe(elapsed, method, route)
+            REQUEST_QUERIES.observe(queries[0], method, route)
+            REQUEST_DB_DURATION.observe(queries[1], method, route)
@@ -0,0 +1,192 @@
+import cProfile
+import hmac
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Профилирование выключено, пока не задан PROFILE_TOKEN (запрос с заголовком
+# X-Profile: <токен>) или PROFILE_SAMPLE_RATE (доля запросов от 0 до 1)
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+# Каталог, куда дополнительно сохраняются профили (.prof для snakeviz/pstats и .json)
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+# Запросы к базе дольше порога пишутся в лог library.sql.slow (0 — выключено)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100"))
+# Ограничение длины SQL и параметров в записи о медленном запросе
+SLOW_QUERY_MAX_LENGTH = 2000
+# Параметры SQL (значения из запросов пользователей) по умолчанию не сохраняются.
+# Даже если они включены, параметры запросов к таблицам с email, хешами паролей
+# и токенами скрываются
+PROFILE_SQL_PARAMETERS = os.getenv("PROFILE_SQL_PARAMETERS", "false").lower() == "true"
+SENSITIVE_TABLES = re.compile(r"\b(users|refresh_tokens)\b", re.IGNORECASE)
+REDACTED = "<redacted>"
+
+logger = logging.getLogger("library.sql.slow")
+
+recent_profiles: deque = deque(maxlen=PROFILE_BUFFER_SIZE)
+recent_slow_queries: deque = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+
+# SQL-запросы профилируемого HTTP-запроса; None, если профилирование не включено
+_trace: ContextVar[Optional[List[dict]]] = ContextVar("profile_trace", default=None)
+_profile_ids = itertools.count(1)
+# cProfile нельзя включить дважды одновременно, поэтому профилируется не больше
+# одного запроса за раз; остальные выполняются без профиля
+_profiler_lock = threading.Lock()
+
+
+def _truncate(value: str) -> str:
+    if len(value) > SLOW_QUERY_MAX_LENGTH:
+        return value[:SLOW_QUERY_MAX_LENGTH] + "..."
+    return value
+
+
+def _parameters(statement: str, parameters) -> Optional[str]:
+    if not PROFILE_SQL_PARAMETERS:
+        return None
+    if SENSITIVE_TABLES.search(statement):
+        return REDACTED
+    return _truncate(repr(parameters))
+
+
+def record_query(statement: str, parameters, started: float, elapsed: float) -> None:
+    # Вызывается из событий движка после каждого запроса к базе
+    trace = _trace.get()
+    if trace is not None:
+        trace.append({
+            "sql": _truncate(statement),
+            "parameters": _parameters(statement, parameters),
+            "started_at": started,
+            "duration_ms": round(elapsed * 1000, 3),
+        })
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "sql": _truncate(statement),
+            "parameters": _parameters(statement, parameters),
+            "duration_ms": round(elapsed * 1000, 3),
+        }
+        recent_slow_queries.append(entry)
+        logger.warning(
+            "Slow query (%.1f ms): %s; parameters: %s",
+            entry["duration_ms"], entry["sql"], entry["parameters"]
+        )
+
+
+def _wants_profile(scope) -> bool:
+    if PROFILE_TOKEN:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                # Сравнение за постоянное время, как у токена в /system/profiles
+                return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _save(profile: dict, profiler: cProfile.Profile) -> None:
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{profile['id']:06d}-{profile['method']}"
+    profiler.dump_stats(str(directory / f"{name}.prof"))
+    (directory / f"{name}.json").write_text(json.dumps(profile, ensure_ascii=False, indent=2))
+
+
+def get_profile(profile_id: int) -> Optional[dict]:
+    for profile in list(recent_profiles):
+        if profile["id"] == profile_id:
+            return profile
+    return None
+
+
+def profile_summaries() -> List[dict]:
+    return [
+        {key: value for key, value in profile.items() if key not in ("queries", "stats")}
+        for profile in reversed(list(recent_profiles))
+    ]
+
+
+# Чистый ASGI-middleware. Без заголовка и выборки стоит одной проверки на запрос.
+# cProfile замеряет весь поток event loop, поэтому в профиль могут попасть и
+# параллельно обрабатываемые запросы; список SQL-запросов собирается только для
+# профилируемого запроса
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not (PROFILE_TOKEN or PROFILE_SAMPLE_RATE)
+            or not _wants_profile(scope)
+            or not _profiler_lock.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = next(_profile_ids)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.lower().encode(), str(profile_id).encode())
+                ]
+            await send(message)
+
+        queries: List[dict] = []
+        token = _trace.set(queries)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            _trace.reset(token)
+            _profiler_lock.release()
+
+            for query in queries:
+                query["started_at"] = round((query["started_at"] - started) * 1000, 3)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(
+                PROFILE_TOP_FUNCTIONS
+            )
+            profile = {
+                "id": profile_id,
+                "at": datetime.utcnow().isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", None),
+                "status": status_code,
+                "duration_ms": round(elapsed * 1000, 3),
+                "query_count": len(queries),
+                "query_ms": round(sum(query["duration_ms"] for query in queries), 3),
+                "queries": queries,
+                "stats": output.getvalue(),
+            }
+            recent_profiles.append(profile)
+            if PROFILE_DIR:
+                _save(profile, profiler)
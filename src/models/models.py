@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, CheckConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, CheckConstraint, DDL, Index, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..database.database import Base
@@ -10,6 +10,61 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    # Увеличивается при выходе из системы: все выданные ранее токены отзываются
+    token_version = Column(Integer, default=0, server_default='0', nullable=False)
+    # Когда последний раз менялись token_version или is_active: воркеры читают в
+    # список отзыва только изменения за время жизни токена доступа
+    tokens_changed_at = Column(DateTime, nullable=True, index=True)
+
+# tokens_changed_at ставит сама база при любом изменении token_version или
+# is_active, в том числе пакетным UPDATE или скриптом в обход ORM: иначе список
+# отзыва не увидел бы такую деактивацию до истечения токена. Формат времени —
+# как у DateTime в SQLite (% удвоены: DDL подставляет параметры через %)
+USERS_TOKENS_CHANGED_SQLITE = [
+    """CREATE TRIGGER IF NOT EXISTS users_tokens_changed_au
+    AFTER UPDATE OF token_version, is_active ON users
+    WHEN old.token_version IS NOT new.token_version OR old.is_active IS NOT new.is_active
+    BEGIN
+        UPDATE users SET tokens_changed_at = strftime('%%Y-%%m-%%d %%H:%%M:%%f000', 'now')
+        WHERE id = new.id;
+    END""",
+]
+
+USERS_TOKENS_CHANGED_POSTGRESQL = [
+    """CREATE OR REPLACE FUNCTION users_stamp_tokens_changed() RETURNS trigger AS $$
+    BEGIN
+        IF new.token_version IS DISTINCT FROM old.token_version
+                OR new.is_active IS DISTINCT FROM old.is_active THEN
+            new.tokens_changed_at := timezone('utc', now());
+        END IF;
+        RETURN new;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER users_tokens_changed_bu
+    BEFORE UPDATE OF token_version, is_active ON users
+    FOR EACH ROW EXECUTE FUNCTION users_stamp_tokens_changed()""",
+]
+
+for statement in USERS_TOKENS_CHANGED_SQLITE:
+    event.listen(User.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in USERS_TOKENS_CHANGED_POSTGRESQL:
+    event.listen(User.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # SHA-256 от токена: сам токен в базе не хранится
+    token_hash = Column(String(64), unique=True, nullable=False)
+    # Все токены, полученные ротацией от одного входа по паролю
+    family = Column(String(32), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    # Когда токен обменян на новый; повторное предъявление — признак кражи
+    used_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
 
 class Book(Base):
     __tablename__ = "books"
@@ -26,17 +81,77 @@ class Book(Base):
 
     __table_args__ = (
         CheckConstraint('copies_available >= 0', name='check_copies_available'),
+        # Индексы под фильтры и сортировки списка книг
+        Index('ix_books_author_publication_year', 'author', 'publication_year'),
+        Index('ix_books_publication_year_id', 'publication_year', 'id'),
+        # Частичный индекс: только книги, которые можно выдать
+        Index(
+            'ix_books_available', 'id',
+            postgresql_where=copies_available > 0,
+            sqlite_where=copies_available > 0
+        ),
     )
 
+# Полнотекстовый индекс по названию, автору и описанию книги. В SQLite это
+# внешняя (content=) таблица FTS5, которую синхронизируют триггеры; в PostgreSQL —
+# генерируемая колонка tsvector с GIN-индексом. В обоих случаях индекс обновляется
+# самой базой при любом INSERT/UPDATE/DELETE, включая пакетный импорт
+BOOKS_FTS_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, description,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, description
+    ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+]
+
+BOOKS_FTS_POSTGRESQL = [
+    """ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(author, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING gin (search_vector)",
+]
+
+for statement in BOOKS_FTS_SQLITE:
+    event.listen(Book.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in BOOKS_FTS_POSTGRESQL:
+    event.listen(Book.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(
+    Book.__table__, "after_drop", DDL("DROP TABLE IF EXISTS books_fts").execute_if(dialect="sqlite")
+)
+
 class Reader(Base):
     __tablename__ = "readers"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
+    # Число невозвращенных книг; меняется в одной транзакции с выдачей и возвратом
+    active_loans = Column(Integer, default=0, server_default='0', nullable=False)
     
     borrowed_books = relationship("BorrowedBook", back_populates="reader")
 
+    __table_args__ = (
+        CheckConstraint('active_loans >= 0', name='check_active_loans'),
+    )
+
 class BorrowedBook(Base):
     __tablename__ = "borrowed_books"
 
@@ -48,3 +163,10 @@ class BorrowedBook(Base):
     
     book = relationship("Book", back_populates="borrowed_books")
     reader = relationship("Reader", back_populates="borrowed_books")
+
+    __table_args__ = (
+        # Подсчет активных выдач читателя при каждой выдаче и фильтр по читателю
+        Index('ix_borrowed_books_reader_id_return_date', 'reader_id', 'return_date'),
+        Index('ix_borrowed_books_book_id_return_date', 'book_id', 'return_date'),
+        Index('ix_borrowed_books_borrow_date_id', 'borrow_date', 'id'),
+    )
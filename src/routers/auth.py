@@ -1,48 +1,95 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from ..schemas.schemas import User, UserCreate, Token
+from ..schemas.schemas import RefreshRequest, User, UserCreate, Token
 from ..models.models import User as UserModel
 from ..auth.auth import (
     authenticate_user,
     create_access_token,
-    get_password_hash,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    get_current_user,
+    revoke_tokens,
+    token_claims,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    TOKENS_ISSUED
 )
-from ..database.database import get_db
+from ..auth.hashing import hash_password
+from ..auth.refresh import issue_refresh_token, revoke_refresh_tokens, rotate_refresh_token
+from ..database.database import get_async_db
 
 router = APIRouter()
 
 @router.post("/register", response_model=User)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(UserModel).filter(UserModel.email == user.email).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(UserModel).filter(UserModel.email == user.email))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = UserModel(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # Вход по паролю начинает новую цепочку refresh-токенов
+    response = token_response(user, issue_refresh_token(db, user.id))
+    await db.commit()
+    TOKENS_ISSUED.inc("password")
+    return response
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(
+    request: RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Новая пара токенов без пароля: refresh-токен обменивается на новый,
+    # старый больше не принимается
+    user_id, refresh_token = await rotate_refresh_token(db, request.refresh_token)
+    user = await db.get(UserModel, user_id)
+    if user is None or not user.is_active:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Inactive user")
+    response = token_response(user, refresh_token)
+    await db.commit()
+    TOKENS_ISSUED.inc("refresh")
+    return response
+
+@router.post("/logout")
+async def logout(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Отзываются все токены пользователя, выданные до этого момента, и его
+    # refresh-токены; коммит общий в revoke_tokens
+    await revoke_refresh_tokens(db, current_user.id)
+    await revoke_tokens(db, current_user.id)
+    return {"message": "Logged out successfully"}
+
+def token_response(user: UserModel, refresh_token: str) -> dict:
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(access_token_expires.total_seconds()),
+    }
@@ -1,72 +1,260 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..schemas.schemas import Book, BookCreate
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from ..schemas.schemas import Book, BookCreate, BookImportReport
 from ..models.models import Book as BookModel
-from ..database.database import get_db
+from ..database.database import get_async_db
+from ..database.replicas import get_read_db, get_read_session_factory, sticky_reads
 from ..auth.auth import get_current_active_user
+from ..cache.responses import (
+    BOOKS_NAMESPACES,
+    book_key,
+    book_namespaces,
+    books_key,
+    catalog_cache,
+    catalog_flight,
+    invalidate_books,
+)
+from ..services import catalog_io
+from ..services.search import search_books
+from ..utils.pagination import CURSOR_HEADER, PAGE_MAX_LIMIT, KeysetPage
+from ..utils.fast_json import FAST_DESCRIPTION, dumps, row_dicts, schema_columns
+from ..utils.fields import field_columns, sparse_fields
+from ..utils.streaming import STREAM_FORMATS, streaming_list_response
 
 router = APIRouter()
 
+# Колонки, по которым разрешена сортировка и курсорная пагинация
+BOOK_SORTABLE = {
+    "id": BookModel.id,
+    "title": BookModel.title,
+    "author": BookModel.author,
+    "publication_year": BookModel.publication_year,
+}
+BOOK_COLUMNS = schema_columns(BookModel, Book)
+book_fields = sparse_fields(Book)
+
+# Прочитанное с реплики сразу после изменения могло еще не включать его: такой
+# ответ отдается без кэширования, иначе устаревшие данные жили бы весь TTL под
+# уже новой версией ключа
+async def cacheable(db: AsyncSession, namespaces) -> bool:
+    return not db.info.get("replica") or await catalog_cache.settled(*namespaces)
+
+# Фильтры списка книг; каждому соответствует индекс из миграции 004
+def book_filters(
+    author: Optional[str] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    available: Optional[bool] = None,
+    isbn: Optional[str] = None
+) -> list:
+    filters = []
+    if author is not None:
+        filters.append(BookModel.author == author)
+    if year_from is not None:
+        filters.append(BookModel.publication_year >= year_from)
+    if year_to is not None:
+        filters.append(BookModel.publication_year <= year_to)
+    if available is not None:
+        filters.append(
+            BookModel.copies_available > 0 if available else BookModel.copies_available == 0
+        )
+    if isbn is not None:
+        filters.append(BookModel.isbn == isbn.replace("-", ""))
+    return filters
+
 @router.post("/books/", response_model=Book)
-def create_book(
+async def create_book(
     book: BookCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     db_book = BookModel(**book.dict())
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    await db.commit()
+    await db.refresh(db_book)
+    await invalidate_books([db_book.id])
     return db_book
 
 @router.get("/books/", response_model=List[Book])
-def read_books(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+async def read_books(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=PAGE_MAX_LIMIT),
+    after: Optional[str] = None,
+    sort: str = "id",
+    stream: Optional[str] = Query(None, pattern=STREAM_FORMATS),
+    fast: bool = Query(False, description=FAST_DESCRIPTION),
+    fields: Optional[List[str]] = Depends(book_fields),
+    filters: list = Depends(book_filters),
+    db: AsyncSession = Depends(get_read_db),
+    session_factory=Depends(get_read_session_factory),
+    sticky: bool = Depends(sticky_reads)
 ):
-    books = db.query(BookModel).offset(skip).limit(limit).all()
+    page = KeysetPage(BookModel, BOOK_SORTABLE, sort=sort, after=after, skip=skip, limit=limit)
+    # Узкий список (?fields=) читает из базы только нужные колонки и, как и
+    # быстрый режим, отдается без схемы ответа
+    fast = fast or fields is not None
+    columns = field_columns(BookModel, fields, page.column) if fields else BOOK_COLUMNS
+    query = (select(*columns) if fast else select(BookModel)).where(*filters)
+    if stream:
+        return streaming_list_response(
+            session_factory, page.apply(query, peek=False), Book, stream, fast, fields
+        )
+
+    # Готовые страницы кэшируются по набору параметров запроса. Клиент, только
+    # что изменивший данные, читает основную базу мимо кэша и общего чтения: их
+    # мог заполнить запрос к отстающей реплике
+    key = await books_key(request.query_params.multi_items())
+    entry = None if sticky else await catalog_cache.get(key)
+    if entry is None:
+        async def load():
+            result = await db.execute(page.apply(query))
+            if fast:
+                books = dumps(row_dicts(page.finish(result.all()), fields))
+            else:
+                books = [Book.model_validate(book) for book in page.finish(result.scalars().all())]
+            headers = {CURSOR_HEADER: page.next_cursor} if page.next_cursor else {}
+            shared = await cacheable(db, BOOKS_NAMESPACES)
+            return await catalog_cache.put(key, books, headers, shared=shared)
+
+        entry = await load() if sticky else await catalog_flight.do(key, load)
+    return catalog_cache.respond(request, entry)
+
+@router.get("/search", response_model=List[Book])
+async def search_catalog(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Поиск по названию, автору и описанию с ранжированием по релевантности
+    books, next_cursor = await search_books(db, q, limit, after)
+    if next_cursor:
+        response.headers[CURSOR_HEADER] = next_cursor
     return books
 
+@router.post("/books/import", response_model=BookImportReport)
+async def import_books(
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(catalog_io.IMPORT_BATCH_SIZE, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    file_format = file_format or catalog_io.detect_format(file.filename, file.content_type)
+    if file_format is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Cannot detect file format, pass ?format=csv|ndjson"
+        )
+
+    # Разбор и валидация пачки идут в пуле потоков, запись — пачками через
+    # INSERT ... ON CONFLICT (ISBN) с коммитом после каждой пачки
+    rows = catalog_io.iter_rows(file.file, file_format)
+    report = catalog_io.new_report()
+    while True:
+        valid, errors = await run_in_threadpool(catalog_io.read_batch, rows, batch_size)
+        if not valid and not errors:
+            break
+        counts = await db.run_sync(catalog_io.write_batch, valid)
+        catalog_io.merge_batch(report, counts, errors, len(valid) + len(errors))
+        if valid:
+            await invalidate_books()
+    return report
+
+@router.get("/books/export")
+async def export_books(
+    file_format: str = Query("ndjson", alias="format", pattern="^(csv|ndjson)$"),
+    session_factory=Depends(get_read_session_factory),
+    current_user: dict = Depends(get_current_active_user)
+):
+    async def generate():
+        yield catalog_io.export_header(file_format)
+        async with session_factory() as db:
+            # Строки читаются серверным курсором порциями, таблица целиком в память не попадает
+            result = await db.stream(
+                catalog_io.export_statement().execution_options(
+                    yield_per=catalog_io.EXPORT_CHUNK_SIZE
+                )
+            )
+            async for rows in result.partitions():
+                yield catalog_io.export_chunk(rows, file_format)
+
+    media_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=books.{file_format}"}
+    )
+
 @router.get("/books/{book_id}", response_model=Book)
-def read_book(
+async def read_book(
     book_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    fields: Optional[List[str]] = Depends(book_fields),
+    db: AsyncSession = Depends(get_read_db),
+    sticky: bool = Depends(sticky_reads)
 ):
-    db_book = db.query(BookModel).filter(BookModel.id == book_id).first()
-    if db_book is None:
-        raise HTTPException(status_code=404, detail="Book not found")
-    return db_book
+    key = await book_key(book_id, fields)
+    entry = None if sticky else await catalog_cache.get(key)
+    if entry is None:
+        # Популярную карточку одновременно запрашивают многие клиенты: базу
+        # читает один запрос, остальные получают его результат или его 404
+        async def load():
+            if fields:
+                result = await db.execute(
+                    select(*field_columns(BookModel, fields)).where(BookModel.id == book_id)
+                )
+                row = result.first()
+                if row is None:
+                    raise HTTPException(status_code=404, detail="Book not found")
+                content = dumps(row_dicts([row], fields)[0])
+            else:
+                db_book = await db.get(BookModel, book_id)
+                if db_book is None:
+                    raise HTTPException(status_code=404, detail="Book not found")
+                content = Book.model_validate(db_book)
+            shared = await cacheable(db, book_namespaces(book_id))
+            return await catalog_cache.put(key, content, shared=shared)
+
+        entry = await load() if sticky else await catalog_flight.do(key, load)
+    return catalog_cache.respond(request, entry)
 
 @router.put("/books/{book_id}", response_model=Book)
-def update_book(
+async def update_book(
     book_id: int,
     book: BookCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    db_book = db.query(BookModel).filter(BookModel.id == book_id).first()
+    db_book = await db.get(BookModel, book_id)
     if db_book is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    
+
     for key, value in book.dict().items():
         setattr(db_book, key, value)
-    
-    db.commit()
-    db.refresh(db_book)
+
+    await db.commit()
+    await db.refresh(db_book)
+    await invalidate_books([book_id])
     return db_book
 
 @router.delete("/books/{book_id}")
-def delete_book(
+async def delete_book(
     book_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    db_book = db.query(BookModel).filter(BookModel.id == book_id).first()
+    db_book = await db.get(BookModel, book_id)
     if db_book is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    
-    db.delete(db_book)
-    db.commit()
+
+    await db.delete(db_book)
+    await db.commit()
+    await invalidate_books([book_id])
     return {"message": "Book deleted successfully"}
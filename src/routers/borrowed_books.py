@@ -1,122 +1,478 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 from datetime import datetime
-from ..schemas.schemas import BorrowedBook, BorrowedBookCreate
+from ..schemas.schemas import (
+    BorrowedBook,
+    BorrowedBookExpanded,
+    BorrowedBookCreate,
+    BulkBorrowRequest,
+    BulkBorrowResult,
+    BulkReturnRequest,
+    BulkReturnResult,
+)
 from ..models.models import BorrowedBook as BorrowedBookModel
 from ..models.models import Book as BookModel
 from ..models.models import Reader as ReaderModel
-from ..database.database import get_db
+from ..database.database import get_async_db
+from ..database.replicas import get_read_db, get_read_session_factory
 from ..auth.auth import get_current_active_user
+from ..cache.responses import invalidate_books
+from ..utils.pagination import PAGE_MAX_LIMIT, KeysetPage
+from ..utils.fast_json import FAST_DESCRIPTION, FastJSONResponse, row_dicts, schema_columns
+from ..utils.fields import field_columns, sparse_fields
+from ..utils.streaming import STREAM_FORMATS, streaming_list_response
 
 router = APIRouter()
 
+# Бизнес-логика 2: сколько книг читатель может держать одновременно
+MAX_ACTIVE_BORROWS = 3
+
+BORROWED_COLUMNS = (
+    BorrowedBookModel.id,
+    BorrowedBookModel.book_id,
+    BorrowedBookModel.reader_id,
+    BorrowedBookModel.borrow_date,
+    BorrowedBookModel.return_date,
+)
+BORROWED_FAST_COLUMNS = schema_columns(BorrowedBookModel, BorrowedBook)
+borrowed_fields = sparse_fields(BorrowedBook)
+
+BORROWED_SORTABLE = {
+    "id": BorrowedBookModel.id,
+    "borrow_date": BorrowedBookModel.borrow_date,
+    "return_date": BorrowedBookModel.return_date,
+}
+
+# Связи, которые можно встроить в ответ через ?expand=
+BORROWED_RELATIONS = {
+    "book": BorrowedBookModel.book,
+    "reader": BorrowedBookModel.reader,
+}
+
+def borrowed_expand(
+    expand: Optional[str] = Query(None, description="Встроить связанные записи: book, reader")
+) -> List[str]:
+    requested = {name.strip() for name in (expand or "").split(",") if name.strip()}
+    unknown = requested - set(BORROWED_RELATIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Cannot expand {', '.join(sorted(unknown))}. "
+                f"Allowed: {', '.join(BORROWED_RELATIONS)}"
+            )
+        )
+    return [name for name in BORROWED_RELATIONS if name in requested]
+
+def with_relations(query, expand: List[str]):
+    # selectinload: один дополнительный запрос на связь (IN по ключам страницы),
+    # независимо от числа строк; основной запрос и его план не меняются
+    return query.options(*(selectinload(BORROWED_RELATIONS[name]) for name in expand))
+
+def expanded_response(borrows, expand: List[str]) -> JSONResponse:
+    items = [
+        BorrowedBookExpanded.model_validate(
+            {name: getattr(borrow, name) for name in [*BorrowedBook.model_fields, *expand]},
+            from_attributes=True
+        )
+        for borrow in borrows
+    ]
+    # Невстроенные связи в ответ не попадают совсем, а не приходят как null
+    return JSONResponse(jsonable_encoder(items, exclude_unset=True))
+
+def borrowed_filters(
+    reader_id: Optional[int] = None,
+    book_id: Optional[int] = None,
+    active: Optional[bool] = Query(None, description="true — только невозвращенные книги"),
+    borrowed_from: Optional[datetime] = None,
+    borrowed_to: Optional[datetime] = None
+) -> list:
+    filters = []
+    if reader_id is not None:
+        filters.append(BorrowedBookModel.reader_id == reader_id)
+    if book_id is not None:
+        filters.append(BorrowedBookModel.book_id == book_id)
+    if active is not None:
+        filters.append(
+            BorrowedBookModel.return_date.is_(None) if active
+            else BorrowedBookModel.return_date.isnot(None)
+        )
+    if borrowed_from is not None:
+        filters.append(BorrowedBookModel.borrow_date >= borrowed_from)
+    if borrowed_to is not None:
+        filters.append(BorrowedBookModel.borrow_date <= borrowed_to)
+    return filters
+
 @router.post("/borrow/", response_model=BorrowedBook)
-def borrow_book(
+async def borrow_book(
     borrow: BorrowedBookCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    # Проверяем существование книги
-    book = db.query(BookModel).filter(BookModel.id == borrow.book_id).first()
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-    
-    # Проверяем количество доступных экземпляров (Бизнес-логика 1)
-    if book.copies_available <= 0:
+    # Бизнес-логика 1: атомарно занимаем экземпляр. Условие в WHERE не дает двум
+    # параллельным запросам выдать один и тот же последний экземпляр
+    taken = await db.execute(
+        update(BookModel)
+        .where(BookModel.id == borrow.book_id, BookModel.copies_available > 0)
+        .values(copies_available=BookModel.copies_available - 1)
+        .execution_options(synchronize_session=False)
+    )
+    if taken.rowcount == 0:
+        await db.rollback()
+        if await db.get(BookModel, borrow.book_id) is None:
+            raise HTTPException(status_code=404, detail="Book not found")
         raise HTTPException(
             status_code=400,
             detail="No copies of this book available"
         )
-    
-    # Проверяем существование читателя
-    reader = db.query(ReaderModel).filter(ReaderModel.id == borrow.reader_id).first()
-    if not reader:
-        raise HTTPException(status_code=404, detail="Reader not found")
-    
-    # Проверяем количество книг у читателя (Бизнес-логика 2)
-    active_borrows = db.query(BorrowedBookModel).filter(
-        and_(
-            BorrowedBookModel.reader_id == borrow.reader_id,
-            BorrowedBookModel.return_date.is_(None)
-        )
-    ).count()
-    
-    if active_borrows >= 3:
+
+    # Бизнес-логика 2: тем же приемом занимаем место в лимите читателя — один
+    # условный UPDATE строки читателя вместо подсчета его выдач
+    counted = await db.execute(
+        update(ReaderModel)
+        .where(ReaderModel.id == borrow.reader_id, ReaderModel.active_loans < MAX_ACTIVE_BORROWS)
+        .values(active_loans=ReaderModel.active_loans + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if counted.rowcount == 0:
+        # Откатываем и списание экземпляра
+        await db.rollback()
+        if await db.get(ReaderModel, borrow.reader_id) is None:
+            raise HTTPException(status_code=404, detail="Reader not found")
         raise HTTPException(
             status_code=400,
-            detail="Reader has already borrowed maximum number of books (3)"
+            detail=f"Reader has already borrowed maximum number of books ({MAX_ACTIVE_BORROWS})"
         )
-    
-    # Создаем запись о выдаче
-    db_borrow = BorrowedBookModel(**borrow.dict())
-    
-    # Уменьшаем количество доступных экземпляров
-    book.copies_available -= 1
-    
-    db.add(db_borrow)
-    db.commit()
-    db.refresh(db_borrow)
-    
+
+    inserted = await db.execute(
+        insert(BorrowedBookModel)
+        .values(book_id=borrow.book_id, reader_id=borrow.reader_id, borrow_date=datetime.utcnow())
+        .returning(*BORROWED_COLUMNS)
+    )
+    db_borrow = inserted.mappings().first()
+
+    await db.commit()
+    await invalidate_books([borrow.book_id])
     return db_borrow
 
+@router.post("/borrow/bulk/", response_model=BulkBorrowResult)
+async def bulk_borrow_books(
+    request: BulkBorrowRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    book_ids = {item.book_id for item in request.items}
+    reader_ids = {item.reader_id for item in request.items}
+
+    # Блокируем строки книг до конца транзакции (в PostgreSQL), чтобы остатки
+    # не изменились между проверкой и списанием
+    result = await db.execute(
+        select(BookModel.id, BookModel.copies_available)
+        .where(BookModel.id.in_(book_ids))
+        .with_for_update()
+    )
+    copies = dict(result.all())
+    # Счетчики выдач читаются вместе с проверкой существования читателей
+    result = await db.execute(
+        select(ReaderModel.id, ReaderModel.active_loans)
+        .where(ReaderModel.id.in_(reader_ids))
+        .with_for_update()
+    )
+    active_borrows = dict(result.all())
+    known_readers = set(active_borrows)
+
+    # Распределяем экземпляры по элементам в порядке запроса
+    results = []
+    taken = {}
+    loans = {}
+    accepted = []
+    for item in request.items:
+        detail = None
+        if item.book_id not in copies:
+            detail = "Book not found"
+        elif copies[item.book_id] - taken.get(item.book_id, 0) <= 0:
+            detail = "No copies of this book available"
+        elif item.reader_id not in known_readers:
+            detail = "Reader not found"
+        elif active_borrows.get(item.reader_id, 0) >= MAX_ACTIVE_BORROWS:
+            detail = f"Reader has already borrowed maximum number of books ({MAX_ACTIVE_BORROWS})"
+        if detail is None:
+            taken[item.book_id] = taken.get(item.book_id, 0) + 1
+            active_borrows[item.reader_id] += 1
+            loans[item.reader_id] = loans.get(item.reader_id, 0) + 1
+            accepted.append(len(results))
+        results.append({**item.dict(), "ok": detail is None, "detail": detail})
+
+    if accepted:
+        borrow_date = datetime.utcnow()
+        try:
+            # Остаток проверяется и в самом UPDATE: без блокировки строк (SQLite)
+            # параллельная выдача могла списать экземпляры после чтения
+            removed = case(taken, value=BookModel.id)
+            written_off = await db.execute(
+                update(BookModel)
+                .where(BookModel.id.in_(taken), BookModel.copies_available >= removed)
+                .values(copies_available=BookModel.copies_available - removed)
+                .execution_options(synchronize_session=False)
+            )
+            if written_off.rowcount != len(taken):
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Copies changed concurrently, retry the batch"
+                )
+            # Так же и лимит читателя
+            added = case(loans, value=ReaderModel.id)
+            counted = await db.execute(
+                update(ReaderModel)
+                .where(
+                    ReaderModel.id.in_(loans),
+                    ReaderModel.active_loans + added <= MAX_ACTIVE_BORROWS
+                )
+                .values(active_loans=ReaderModel.active_loans + added)
+                .execution_options(synchronize_session=False)
+            )
+            if counted.rowcount != len(loans):
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Loans changed concurrently, retry the batch"
+                )
+            inserted = await db.execute(
+                insert(BorrowedBookModel.__table__).returning(
+                    *BORROWED_COLUMNS, sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "book_id": results[i]["book_id"],
+                        "reader_id": results[i]["reader_id"],
+                        "borrow_date": borrow_date,
+                    }
+                    for i in accepted
+                ]
+            )
+            for i, row in zip(accepted, inserted.mappings().all()):
+                results[i]["borrow"] = row
+            await db.commit()
+            await invalidate_books(taken)
+        except IntegrityError:
+            # Ограничения copies_available >= 0 и active_loans >= 0 — последняя линия
+            # защиты, если условия в UPDATE не учли какую-то гонку
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Copies changed concurrently, retry the batch"
+            )
+
+    return {
+        "succeeded": len(accepted),
+        "failed": len(results) - len(accepted),
+        "results": results,
+    }
+
+@router.post("/return/bulk/", response_model=BulkReturnResult)
+async def bulk_return_books(
+    request: BulkReturnRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    # Закрываем все открытые выдачи из списка одним UPDATE
+    returned = await db.execute(
+        update(BorrowedBookModel)
+        .where(
+            BorrowedBookModel.id.in_(set(request.borrow_ids)),
+            BorrowedBookModel.return_date.is_(None)
+        )
+        .values(return_date=datetime.utcnow())
+        .returning(BorrowedBookModel.id, BorrowedBookModel.book_id, BorrowedBookModel.reader_id)
+        .execution_options(synchronize_session=False)
+    )
+    returned_rows = returned.all()
+    returned_books = {row.id: row.book_id for row in returned_rows}
+
+    missing = set(request.borrow_ids) - set(returned_books)
+    existing = set()
+    if missing:
+        result = await db.execute(
+            select(BorrowedBookModel.id).where(BorrowedBookModel.id.in_(missing))
+        )
+        existing = set(result.scalars().all())
+
+    returned_copies = {}
+    returned_loans = {}
+    for row in returned_rows:
+        returned_copies[row.book_id] = returned_copies.get(row.book_id, 0) + 1
+        returned_loans[row.reader_id] = returned_loans.get(row.reader_id, 0) + 1
+    if returned_copies:
+        await db.execute(
+            update(BookModel)
+            .where(BookModel.id.in_(returned_copies))
+            .values(
+                copies_available=BookModel.copies_available
+                + case(returned_copies, value=BookModel.id)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            update(ReaderModel)
+            .where(ReaderModel.id.in_(returned_loans))
+            .values(
+                active_loans=ReaderModel.active_loans
+                - case(returned_loans, value=ReaderModel.id)
+            )
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    if returned_copies:
+        await invalidate_books(returned_copies)
+
+    results = []
+    seen = set()
+    for borrow_id in request.borrow_ids:
+        if borrow_id in returned_books and borrow_id not in seen:
+            results.append({"borrow_id": borrow_id, "ok": True})
+        elif borrow_id in returned_books or borrow_id in existing:
+            results.append({
+                "borrow_id": borrow_id, "ok": False, "detail": "This book has already been returned"
+            })
+        else:
+            results.append({
+                "borrow_id": borrow_id, "ok": False, "detail": "Borrow record not found"
+            })
+        seen.add(borrow_id)
+
+    return {
+        "succeeded": len(returned_books),
+        "failed": len(results) - len(returned_books),
+        "results": results,
+    }
+
 @router.post("/return/{borrow_id}")
-def return_book(
+async def return_book(
     borrow_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    # Находим запись о выдаче
-    borrow = db.query(BorrowedBookModel).filter(BorrowedBookModel.id == borrow_id).first()
-    if not borrow:
-        raise HTTPException(status_code=404, detail="Borrow record not found")
-    
-    # Проверяем, не была ли книга уже возвращена (Бизнес-логика 3)
-    if borrow.return_date is not None:
+    # Закрываем выдачу одним условным UPDATE (Бизнес-логика 3): повторный
+    # или параллельный возврат той же записи не пройдет условие return_date IS NULL
+    returned = await db.execute(
+        update(BorrowedBookModel)
+        .where(BorrowedBookModel.id == borrow_id, BorrowedBookModel.return_date.is_(None))
+        .values(return_date=datetime.utcnow())
+        .returning(BorrowedBookModel.book_id, BorrowedBookModel.reader_id)
+        .execution_options(synchronize_session=False)
+    )
+    returned_row = returned.first()
+    if returned_row is None:
+        await db.rollback()
+        if await db.get(BorrowedBookModel, borrow_id) is None:
+            raise HTTPException(status_code=404, detail="Borrow record not found")
         raise HTTPException(
             status_code=400,
             detail="This book has already been returned"
         )
-    
-    # Обновляем запись о возврате
-    borrow.return_date = datetime.utcnow()
-    
-    # Увеличиваем количество доступных экземпляров
-    book = db.query(BookModel).filter(BookModel.id == borrow.book_id).first()
-    book.copies_available += 1
-    
-    db.commit()
-    
+
+    # Увеличиваем количество доступных экземпляров и освобождаем место в лимите читателя
+    book_id, reader_id = returned_row
+    await db.execute(
+        update(BookModel)
+        .where(BookModel.id == book_id)
+        .values(copies_available=BookModel.copies_available + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(ReaderModel)
+        .where(ReaderModel.id == reader_id)
+        .values(active_loans=ReaderModel.active_loans - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await invalidate_books([book_id])
+
     return {"message": "Book returned successfully"}
 
 @router.get("/borrowed-books/reader/{reader_id}", response_model=List[BorrowedBook])
-def get_reader_borrowed_books(
+async def get_reader_borrowed_books(
     reader_id: int,
-    db: Session = Depends(get_db),
+    fields: Optional[List[str]] = Depends(borrowed_fields),
+    expand: List[str] = Depends(borrowed_expand),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(get_current_active_user)
 ):
+    if expand and fields is not None:
+        raise HTTPException(status_code=400, detail="expand cannot be combined with fields")
+
     # Проверяем существование читателя
-    reader = db.query(ReaderModel).filter(ReaderModel.id == reader_id).first()
+    reader = await db.get(ReaderModel, reader_id)
     if not reader:
         raise HTTPException(status_code=404, detail="Reader not found")
-    
+
     # Получаем список всех невозвращенных книг читателя
-    borrowed_books = db.query(BorrowedBookModel).filter(
-        and_(
-            BorrowedBookModel.reader_id == reader_id,
-            BorrowedBookModel.return_date.is_(None)
+    query = select(*field_columns(BorrowedBookModel, fields)) if fields else select(BorrowedBookModel)
+    query = with_relations(query, expand)
+    result = await db.execute(
+        query.filter(
+            and_(
+                BorrowedBookModel.reader_id == reader_id,
+                BorrowedBookModel.return_date.is_(None)
+            )
         )
-    ).all()
-    
-    return borrowed_books
+    )
+
+    if fields:
+        return FastJSONResponse(row_dicts(result.all(), fields))
+    if expand:
+        return expanded_response(result.scalars().all(), expand)
+    return result.scalars().all()
 
 @router.get("/borrowed-books/", response_model=List[BorrowedBook])
-def get_all_borrowed_books(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+async def get_all_borrowed_books(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=PAGE_MAX_LIMIT),
+    after: Optional[str] = None,
+    sort: str = "id",
+    stream: Optional[str] = Query(None, pattern=STREAM_FORMATS),
+    fast: bool = Query(False, description=FAST_DESCRIPTION),
+    fields: Optional[List[str]] = Depends(borrowed_fields),
+    expand: List[str] = Depends(borrowed_expand),
+    filters: list = Depends(borrowed_filters),
+    db: AsyncSession = Depends(get_read_db),
+    session_factory=Depends(get_read_session_factory),
     current_user: dict = Depends(get_current_active_user)
 ):
-    borrowed_books = db.query(BorrowedBookModel).offset(skip).limit(limit).all()
+    if expand and (fast or fields is not None or stream):
+        raise HTTPException(
+            status_code=400, detail="expand cannot be combined with fast, fields or stream"
+        )
+    page = KeysetPage(
+        BorrowedBookModel, BORROWED_SORTABLE, sort=sort, after=after, skip=skip, limit=limit
+    )
+    fast = fast or fields is not None
+    columns = (
+        field_columns(BorrowedBookModel, fields, page.column) if fields else BORROWED_FAST_COLUMNS
+    )
+    query = (select(*columns) if fast else select(BorrowedBookModel)).where(*filters)
+    query = with_relations(query, expand)
+    if stream:
+        return streaming_list_response(
+            session_factory, page.apply(query, peek=False), BorrowedBook, stream, fast, fields
+        )
+    result = await db.execute(page.apply(query))
+    if fast:
+        fast_response = FastJSONResponse(row_dicts(page.finish(result.all()), fields))
+        page.set_header(fast_response)
+        return fast_response
+    borrowed_books = page.finish(result.scalars().all())
+    if expand:
+        response = expanded_response(borrowed_books, expand)
+        page.set_header(response)
+        return response
+    page.set_header(response)
     return borrowed_books
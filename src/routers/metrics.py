@@ -0,0 +1,96 @@
+import hmac
+import os
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from ..auth.auth import user_cache
+from ..auth.hashing import hashing_pool
+from ..auth.revocation import revocations
+from ..cache.responses import catalog_cache
+from ..database.database import get_pool_statistics
+from ..limits.admission import admission
+from ..metrics.registry import CONTENT_TYPE, registry
+
+load_dotenv()
+
+# Если задан, /metrics требует заголовок Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+router = APIRouter()
+
+# Значения, которые уже считаются в пулах, кэшах и пуле хеширования, читаются
+# только в момент запроса /metrics и не добавляют работы обычным запросам
+@registry.collector
+def _pool_metrics():
+    pools = get_pool_statistics()
+    families = [
+        ("db_pool_checkouts_total", "counter", "Connections handed out by the pool", "checkouts"),
+        ("db_pool_timeouts_total", "counter", "Pool checkouts that timed out", "timeouts"),
+        ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection",
+         "wait_seconds_total"),
+        ("db_pool_checked_out", "gauge", "Connections currently in use", "checked_out"),
+        ("db_pool_overflow", "gauge", "Connections opened above pool_size", "overflow"),
+    ]
+    return [
+        (name, kind, documentation, [
+            (name, {"pool": pool}, stats[key]) for pool, stats in pools.items() if key in stats
+        ])
+        for name, kind, documentation, key in families
+    ]
+
+@registry.collector
+def _hashing_metrics():
+    stats = hashing_pool.stats()
+    return [
+        ("password_hash_in_flight", "gauge", "Password hash operations running or queued",
+         [("password_hash_in_flight", {}, stats["in_flight"])]),
+        ("password_hash_rejected_total", "counter", "Password hash operations rejected with 429",
+         [("password_hash_rejected_total", {}, stats["rejected"])]),
+    ]
+
+@registry.collector
+def _revocation_metrics():
+    stats = revocations.stats()
+    return [
+        ("auth_revocation_entries", "gauge", "Users with revoked tokens or deactivated",
+         [("auth_revocation_entries", {}, stats["entries"])]),
+        ("auth_revocation_refreshes_total", "counter", "Revocation list reloads from the database",
+         [("auth_revocation_refreshes_total", {}, stats["refreshes"])]),
+    ]
+
+@registry.collector
+def _admission_metrics():
+    stats = admission.stats()
+    return [
+        ("admission_in_flight", "gauge", "Expensive operations currently admitted",
+         [("admission_in_flight", {"operation": name}, item["in_flight"])
+          for name, item in stats.items()]),
+        ("admission_limit", "gauge", "Concurrent expensive operations allowed (0 - unlimited)",
+         [("admission_limit", {"operation": name}, item["limit"]) for name, item in stats.items()]),
+    ]
+
+@registry.collector
+def _cache_metrics():
+    caches = {"users": user_cache.stats(), "catalog": catalog_cache.stats()}
+    families = [
+        ("cache_hits_total", "counter", "Cache hits", "hits"),
+        ("cache_misses_total", "counter", "Cache misses", "misses"),
+        ("cache_evictions_total", "counter", "Entries evicted by size limits", "evictions"),
+        ("cache_entries", "gauge", "Entries currently stored", "size"),
+    ]
+    return [
+        (name, kind, documentation, [
+            (name, {"cache": cache}, stats[key]) for cache, stats in caches.items()
+        ])
+        for name, kind, documentation, key in families
+    ]
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    if METRICS_TOKEN:
+        expected = f"Bearer {METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    # Сборщики читают статистику общего кэша из SQLite, поэтому в пуле потоков
+    return Response(content=await run_in_threadpool(registry.render), media_type=CONTENT_TYPE)
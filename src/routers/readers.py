@@ -1,77 +1,134 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from ..schemas.schemas import Reader, ReaderCreate
 from ..models.models import Reader as ReaderModel
-from ..database.database import get_db
+from ..database.database import get_async_db
+from ..database.replicas import get_read_db, get_read_session_factory
 from ..auth.auth import get_current_active_user
+from ..utils.pagination import PAGE_MAX_LIMIT, KeysetPage
+from ..utils.fast_json import FAST_DESCRIPTION, FastJSONResponse, row_dicts, schema_columns
+from ..utils.fields import field_columns, sparse_fields
+from ..utils.streaming import STREAM_FORMATS, streaming_list_response
 
 router = APIRouter()
 
+READER_SORTABLE = {
+    "id": ReaderModel.id,
+    "name": ReaderModel.name,
+    "email": ReaderModel.email,
+}
+READER_COLUMNS = schema_columns(ReaderModel, Reader)
+reader_fields = sparse_fields(Reader)
+
+def reader_filters(
+    name: Optional[str] = Query(None, description="Начало имени читателя"),
+    email: Optional[str] = None
+) -> list:
+    filters = []
+    if name is not None:
+        filters.append(ReaderModel.name.startswith(name, autoescape=True))
+    if email is not None:
+        filters.append(ReaderModel.email == email)
+    return filters
+
 @router.post("/readers/", response_model=Reader)
-def create_reader(
+async def create_reader(
     reader: ReaderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    db_reader = db.query(ReaderModel).filter(ReaderModel.email == reader.email).first()
+    result = await db.execute(select(ReaderModel).filter(ReaderModel.email == reader.email))
+    db_reader = result.scalars().first()
     if db_reader:
         raise HTTPException(status_code=400, detail="Email already registered")
     db_reader = ReaderModel(**reader.dict())
     db.add(db_reader)
-    db.commit()
-    db.refresh(db_reader)
+    await db.commit()
+    await db.refresh(db_reader)
     return db_reader
 
 @router.get("/readers/", response_model=List[Reader])
-def read_readers(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+async def read_readers(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=PAGE_MAX_LIMIT),
+    after: Optional[str] = None,
+    sort: str = "id",
+    stream: Optional[str] = Query(None, pattern=STREAM_FORMATS),
+    fast: bool = Query(False, description=FAST_DESCRIPTION),
+    fields: Optional[List[str]] = Depends(reader_fields),
+    filters: list = Depends(reader_filters),
+    db: AsyncSession = Depends(get_read_db),
+    session_factory=Depends(get_read_session_factory),
     current_user: dict = Depends(get_current_active_user)
 ):
-    readers = db.query(ReaderModel).offset(skip).limit(limit).all()
+    page = KeysetPage(ReaderModel, READER_SORTABLE, sort=sort, after=after, skip=skip, limit=limit)
+    fast = fast or fields is not None
+    columns = field_columns(ReaderModel, fields, page.column) if fields else READER_COLUMNS
+    query = (select(*columns) if fast else select(ReaderModel)).where(*filters)
+    if stream:
+        return streaming_list_response(
+            session_factory, page.apply(query, peek=False), Reader, stream, fast, fields
+        )
+    result = await db.execute(page.apply(query))
+    if fast:
+        fast_response = FastJSONResponse(row_dicts(page.finish(result.all()), fields))
+        page.set_header(fast_response)
+        return fast_response
+    readers = page.finish(result.scalars().all())
+    page.set_header(response)
     return readers
 
 @router.get("/readers/{reader_id}", response_model=Reader)
-def read_reader(
+async def read_reader(
     reader_id: int,
-    db: Session = Depends(get_db),
+    fields: Optional[List[str]] = Depends(reader_fields),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    db_reader = db.query(ReaderModel).filter(ReaderModel.id == reader_id).first()
+    if fields:
+        result = await db.execute(
+            select(*field_columns(ReaderModel, fields)).where(ReaderModel.id == reader_id)
+        )
+        row = result.first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Reader not found")
+        return FastJSONResponse(row_dicts([row], fields)[0])
+    db_reader = await db.get(ReaderModel, reader_id)
     if db_reader is None:
         raise HTTPException(status_code=404, detail="Reader not found")
     return db_reader
 
 @router.put("/readers/{reader_id}", response_model=Reader)
-def update_reader(
+async def update_reader(
     reader_id: int,
     reader: ReaderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    db_reader = db.query(ReaderModel).filter(ReaderModel.id == reader_id).first()
+    db_reader = await db.get(ReaderModel, reader_id)
     if db_reader is None:
         raise HTTPException(status_code=404, detail="Reader not found")
-    
+
     for key, value in reader.dict().items():
         setattr(db_reader, key, value)
-    
-    db.commit()
-    db.refresh(db_reader)
+
+    await db.commit()
+    await db.refresh(db_reader)
     return db_reader
 
 @router.delete("/readers/{reader_id}")
-def delete_reader(
+async def delete_reader(
     reader_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    db_reader = db.query(ReaderModel).filter(ReaderModel.id == reader_id).first()
+    db_reader = await db.get(ReaderModel, reader_id)
     if db_reader is None:
         raise HTTPException(status_code=404, detail="Reader not found")
-    
-    db.delete(db_reader)
-    db.commit()
+
+    await db.delete(db_reader)
+    await db.commit()
     return {"message": "Reader deleted successfully"}
@@ -0,0 +1,61 @@
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from ..database.database import get_pool_statistics
+from ..auth.auth import get_current_active_user, user_cache
+from ..auth.hashing import hashing_pool
+from ..cache.responses import catalog_cache, catalog_flight
+from ..limits.admission import admission
+from ..limits.buckets import buckets
+from ..metrics import profiling
+
+router = APIRouter()
+
+# Профили и медленные запросы содержат SQL чужих запросов, поэтому читаются
+# только с заголовком X-Profile: <PROFILE_TOKEN>, а без токена недоступны.
+# Любой пользователь может зарегистрироваться, так что токена доступа мало
+def require_profile_token(request: Request):
+    token = profiling.PROFILE_TOKEN
+    if not token or not hmac.compare_digest(
+        request.headers.get(profiling.PROFILE_HEADER, ""), token
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profile token required")
+
+@router.get("/pool")
+async def read_pool_statistics(current_user: dict = Depends(get_current_active_user)):
+    # Состояние пулов соединений: сколько соединений выдано и сколько их ждали
+    return get_pool_statistics()
+
+@router.get("/cache")
+async def read_cache_statistics(current_user: dict = Depends(get_current_active_user)):
+    # Статистика общего кэша читается из SQLite, поэтому в пуле потоков
+    return {
+        "users": await run_in_threadpool(user_cache.stats),
+        "catalog": await run_in_threadpool(catalog_cache.stats),
+        "singleflight": catalog_flight.stats(),
+    }
+
+@router.get("/hashing")
+async def read_hashing_statistics(current_user: dict = Depends(get_current_active_user)):
+    return hashing_pool.stats()
+
+@router.get("/limits")
+async def read_limit_statistics(current_user: dict = Depends(get_current_active_user)):
+    return {"rate_limit": await run_in_threadpool(buckets.stats), "admission": admission.stats()}
+
+@router.get("/profiles")
+async def read_profiles(_: None = Depends(require_profile_token)):
+    # Последние профили без тел: время, маршрут, число и время SQL-запросов
+    return profiling.profile_summaries()
+
+@router.get("/profiles/{profile_id}")
+async def read_profile(profile_id: int, _: None = Depends(require_profile_token)):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/slow-queries")
+async def read_slow_queries(_: None = Depends(require_profile_token)):
+    return list(profiling.recent_slow_queries)
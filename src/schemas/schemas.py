@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -40,6 +40,18 @@ class Book(BookBase):
     class Config:
         from_attributes = True
 
+class BookImportError(BaseModel):
+    line: int
+    errors: List[str]
+
+class BookImportReport(BaseModel):
+    processed: int
+    created: int
+    updated: int
+    duplicates: int
+    failed: int
+    errors: List[BookImportError]
+
 class ReaderBase(BaseModel):
     name: str = Field(..., min_length=2, max_length=100)
     email: EmailStr
@@ -74,9 +86,49 @@ class BorrowedBook(BorrowedBookBase):
     class Config:
         from_attributes = True
 
+# Выдача вместе с книгой и читателем (?expand=book,reader)
+class BorrowedBookExpanded(BorrowedBook):
+    book: Optional[Book] = None
+    reader: Optional[Reader] = None
+
+# Пакетная выдача и возврат: элементы обрабатываются в одной транзакции,
+# результат возвращается по каждому элементу
+BULK_MAX_ITEMS = 500
+
+class BulkBorrowRequest(BaseModel):
+    items: List[BorrowedBookCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkReturnRequest(BaseModel):
+    borrow_ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkBorrowItemResult(BorrowedBookBase):
+    ok: bool
+    detail: Optional[str] = None
+    borrow: Optional[BorrowedBook] = None
+
+class BulkReturnItemResult(BaseModel):
+    borrow_id: int
+    ok: bool
+    detail: Optional[str] = None
+
+class BulkBorrowResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkBorrowItemResult]
+
+class BulkReturnResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkReturnItemResult]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1, max_length=200)
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -0,0 +1,172 @@
+import codecs
+import csv
+import io
+import json
+import os
+from itertools import islice
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models.models import Book as BookModel
+from ..schemas.schemas import BookCreate
+
+load_dotenv()
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Сколько ошибок по строкам возвращается в отчете (остальные только считаются)
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+FORMATS = ("csv", "ndjson")
+BOOK_FIELDS = list(BookCreate.model_fields)
+EXPORT_FIELDS = ["id"] + BOOK_FIELDS
+
+Row = Tuple[int, object]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if filename.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type:
+        return "ndjson"
+    return None
+
+
+def iter_rows(binary_stream: IO[bytes], fmt: str) -> Iterator[Row]:
+    # Файл читается построчно, поэтому в памяти находится только текущая пачка
+    text = codecs.getreader("utf-8-sig")(binary_stream)
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Пустые ячейки CSV означают отсутствие значения
+            data = {key: value for key, value in row.items() if value not in ("", None)}
+            yield reader.line_num, data
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, error
+
+
+def read_batch(rows: Iterator[Row], batch_size: int) -> Tuple[List[Tuple[int, dict]], List[dict]]:
+    valid, errors = [], []
+    for line_number, data in islice(rows, batch_size):
+        if isinstance(data, Exception):
+            errors.append({"line": line_number, "errors": [f"Invalid JSON: {data}"]})
+            continue
+        try:
+            valid.append((line_number, BookCreate.model_validate(data).model_dump()))
+        except ValidationError as error:
+            errors.append({
+                "line": line_number,
+                "errors": [
+                    f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+                    for item in error.errors()
+                ],
+            })
+    return valid, errors
+
+
+def _upsert_statement(dialect_name: str):
+    table = BookModel.__table__
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(table)
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(table)
+    else:
+        raise ValueError(f"Bulk import is not supported for dialect '{dialect_name}'")
+    # Книга с уже существующим ISBN обновляется, а не дублируется
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.isbn],
+        set_={field: stmt.excluded[field] for field in BOOK_FIELDS if field != "isbn"},
+    )
+
+
+def write_batch(session: Session, rows: List[Tuple[int, dict]]) -> Dict[str, int]:
+    # Повтор ISBN внутри одной пачки: остается последняя строка, так как один
+    # INSERT ... ON CONFLICT не может изменить одну и ту же строку дважды
+    by_isbn: Dict[str, dict] = {}
+    values = []
+    for _, data in rows:
+        if data["isbn"] is None:
+            values.append(data)
+        else:
+            by_isbn[data["isbn"]] = data
+    values.extend(by_isbn.values())
+    if not values:
+        return {"created": 0, "updated": 0, "duplicates": 0}
+
+    # Считаем, сколько ISBN из пачки уже есть в каталоге, чтобы разделить
+    # созданные и обновленные книги в отчете
+    existing = 0
+    if by_isbn:
+        existing = session.scalar(
+            select(func.count()).select_from(BookModel).where(BookModel.isbn.in_(by_isbn))
+        )
+
+    session.execute(_upsert_statement(session.get_bind().dialect.name), values)
+    session.commit()
+    return {
+        "created": len(values) - existing,
+        "updated": existing,
+        "duplicates": len(rows) - len(values),
+    }
+
+
+def new_report() -> dict:
+    return {"processed": 0, "created": 0, "updated": 0, "duplicates": 0, "failed": 0, "errors": []}
+
+
+def merge_batch(report: dict, counts: Dict[str, int], errors: List[dict], processed: int) -> None:
+    report["processed"] += processed
+    report["failed"] += len(errors)
+    for key, value in counts.items():
+        report[key] += value
+    room = IMPORT_MAX_REPORTED_ERRORS - len(report["errors"])
+    if room > 0:
+        report["errors"].extend(errors[:room])
+
+
+def import_books(
+    session: Session, binary_stream: IO[bytes], fmt: str, batch_size: int = IMPORT_BATCH_SIZE
+) -> dict:
+    # Синхронный вариант для утилиты командной строки
+    rows = iter_rows(binary_stream, fmt)
+    report = new_report()
+    while True:
+        valid, errors = read_batch(rows, batch_size)
+        if not valid and not errors:
+            return report
+        merge_batch(report, write_batch(session, valid), errors, len(valid) + len(errors))
+
+
+def export_header(fmt: str) -> str:
+    if fmt != "csv":
+        return ""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_FIELDS)
+    return buffer.getvalue()
+
+
+def export_chunk(rows: Iterable, fmt: str) -> str:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def export_statement():
+    return select(*(getattr(BookModel, field) for field in EXPORT_FIELDS)).order_by(BookModel.id)
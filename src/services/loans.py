@@ -0,0 +1,37 @@
+from typing import List
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..models.models import BorrowedBook, Reader
+
+# Фактическое число невозвращенных книг читателя по таблице выдач
+actual_loans = (
+    select(func.count())
+    .select_from(BorrowedBook)
+    .where(BorrowedBook.reader_id == Reader.id, BorrowedBook.return_date.is_(None))
+    .correlate(Reader)
+    .scalar_subquery()
+)
+
+
+def find_mismatches(db: Session) -> List[dict]:
+    # Читатели, у которых счетчик active_loans разошелся с таблицей выдач
+    result = db.execute(
+        select(Reader.id, Reader.active_loans, actual_loans.label("actual"))
+        .where(Reader.active_loans != actual_loans)
+        .order_by(Reader.id)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+def repair_counters(db: Session) -> int:
+    # Пересчитывает только разошедшиеся счетчики и возвращает их количество
+    result = db.execute(
+        update(Reader)
+        .where(Reader.active_loans != actual_loans)
+        .values(active_loans=actual_loans)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,72 @@
+import re
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import Book as BookModel
+from ..utils.pagination import decode_cursor, encode_cursor
+
+# Веса полей при ранжировании в SQLite: совпадение в названии важнее автора и описания
+SQLITE_RANK = "bm25(books_fts, 10.0, 5.0, 1.0)"
+
+books_fts = table("books_fts", column("rowid"))
+
+
+def search_terms(query: str) -> List[str]:
+    # Из запроса берутся только слова: операторы FTS5/tsquery пользователю недоступны
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query must contain at least one word")
+    return terms
+
+
+def _sqlite_statement(terms: List[str]):
+    # Каждое слово ищется как префикс: "tolk ring" найдет "Tolkien" и "Rings"
+    match = " ".join(f'"{term}"*' for term in terms)
+    rank = literal_column(SQLITE_RANK)
+    stmt = (
+        select(BookModel, rank.label("rank"))
+        .join(books_fts, books_fts.c.rowid == BookModel.id)
+        .where(text("books_fts MATCH :match").bindparams(match=match))
+    )
+    # bm25 в SQLite отрицателен: чем меньше значение, тем выше релевантность
+    return stmt, rank, False
+
+
+def _postgresql_statement(terms: List[str]):
+    query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+    vector = literal_column("books.search_vector")
+    rank = func.ts_rank_cd(vector, query)
+    stmt = select(BookModel, rank.label("rank")).where(vector.op("@@")(query))
+    return stmt, rank, True
+
+
+async def search_books(
+    db: AsyncSession, query: str, limit: int, after: Optional[str] = None
+) -> Tuple[list, Optional[str]]:
+    terms = search_terms(query)
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt, rank, descending = _sqlite_statement(terms)
+    elif dialect == "postgresql":
+        stmt, rank, descending = _postgresql_statement(terms)
+    else:
+        raise HTTPException(
+            status_code=501, detail="Full-text search is not supported by this database"
+        )
+
+    if after:
+        # Курсор хранит ранг и id последней книги предыдущей страницы
+        last_rank, last_id = decode_cursor(after, "rank")
+        beyond = rank < last_rank if descending else rank > last_rank
+        stmt = stmt.where(or_(beyond, and_(rank == last_rank, BookModel.id > last_id)))
+
+    stmt = stmt.order_by(rank.desc() if descending else rank.asc(), BookModel.id).limit(limit + 1)
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor("rank", rows[-1].rank, rows[-1].Book.id)
+    return [row.Book for row in rows], next_cursor
@@ -0,0 +1,46 @@
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, List, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson указан в requirements.txt
+    orjson = None
+
+# Быстрый режим списков (?fast=true): из базы выбираются только колонки схемы,
+# строки не проходят повторную валидацию Pydantic (данные уже проверены при
+# записи) и кодируются orjson. Формат JSON совпадает с обычным ответом
+FAST_DESCRIPTION = "Выбрать только колонки и отдать JSON без повторной валидации строк"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def schema_columns(model, schema) -> list:
+    # Колонки в порядке полей схемы, чтобы порядок ключей совпадал с обычным ответом
+    return [getattr(model, field) for field in schema.model_fields]
+
+
+def row_dicts(rows: Iterable, fields: Optional[List[str]] = None) -> List[dict]:
+    if fields is None:
+        return [row._asdict() for row in rows]
+    # Только запрошенные поля, без служебных колонок запроса
+    return [{name: row._mapping[name] for name in fields} for row in rows]
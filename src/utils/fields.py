@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from fastapi import HTTPException, Query
+
+FIELDS_DESCRIPTION = "Поля ответа через запятую, например fields=title,author (id отдается всегда)"
+
+
+def sparse_fields(schema):
+    # Зависимость для ?fields=: запрошенные поля в порядке схемы или None,
+    # если параметр не передан и нужен полный ответ
+    allowed = list(schema.model_fields)
+
+    def dependency(
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
+    ) -> Optional[List[str]]:
+        if fields is None:
+            return None
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested - set(allowed)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Unknown fields: {', '.join(sorted(unknown))}. "
+                    f"Allowed: {', '.join(allowed)}"
+                )
+            )
+        # id нужен клиенту, чтобы связывать записи, и курсору следующей страницы
+        return [name for name in allowed if name == "id" or name in requested]
+
+    return dependency
+
+
+def field_columns(model, fields: List[str], *extra) -> list:
+    # Колонки запрошенных полей плюс служебные (например, колонка сортировки для
+    # курсора): они нужны запросу, но в ответ не попадают
+    columns = [getattr(model, name) for name in fields]
+    columns += [column for column in extra if column.key not in fields]
+    return columns
@@ -0,0 +1,116 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+load_dotenv()
+
+# Заголовок, в котором возвращается курсор следующей страницы
+CURSOR_HEADER = "X-Next-Cursor"
+# Наибольший limit списков; выборки больше ADMISSION_BULK_LIMIT дополнительно
+# ограничиваются контролем допуска
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "10000"))
+
+
+def encode_cursor(sort: str, value: Any, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({"s": sort, "v": value, "i": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, column=None) -> tuple:
+    invalid_cursor = HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, last_id = data["v"], int(data["i"])
+        if data["s"] != sort:
+            raise invalid_cursor
+        if value is not None and column is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise invalid_cursor
+    return value, last_id
+
+
+# Постраничная выборка по ключу (seek) вместо OFFSET: курсор хранит значение
+# колонки сортировки и id последней строки, поэтому следующая страница
+# читается по индексу без пропуска уже отданных строк
+class KeysetPage:
+    def __init__(
+        self,
+        model,
+        sortable: Dict[str, Any],
+        sort: str = "id",
+        after: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ):
+        self.descending = sort.startswith("-")
+        self.sort_name = sort.lstrip("-")
+        if self.sort_name not in sortable:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cannot sort by '{self.sort_name}'. Allowed: {', '.join(sortable)}"
+            )
+        # LIMIT -1 в SQLite означает "без ограничения", а PostgreSQL его не принимает
+        if limit < 1 or skip < 0:
+            raise HTTPException(status_code=400, detail="limit must be positive, skip non-negative")
+        self.sort = sort
+        self.column = sortable[self.sort_name]
+        self.id_column = model.id
+        self.after = decode_cursor(after, sort, self.column) if after else None
+        self.skip = skip
+        self.limit = limit
+        self.next_cursor: Optional[str] = None
+
+    def apply(self, query, peek: bool = True):
+        if self.after is not None:
+            query = query.filter(self._seek(*self.after))
+        elif self.skip:
+            # Совместимость со старыми клиентами, которые листают через skip
+            query = query.offset(self.skip)
+
+        direction = self.column.desc() if self.descending else self.column.asc()
+        if self.column.nullable:
+            # NULL всегда в конце, в обоих направлениях и во всех СУБД одинаково
+            direction = direction.nulls_last()
+        order = [direction]
+        if self.column is not self.id_column:
+            order.append(self.id_column.desc() if self.descending else self.id_column.asc())
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+        return query.order_by(*order).limit(self.limit + 1 if peek else self.limit)
+
+    def _seek(self, value, last_id):
+        tie = self.id_column < last_id if self.descending else self.id_column > last_id
+        if self.column is self.id_column:
+            return tie
+        if value is None:
+            # Курсор уже в хвосте из NULL: дальше идут только NULL с большим id
+            return and_(self.column.is_(None), tie)
+        beyond = self.column < value if self.descending else self.column > value
+        condition = or_(beyond, and_(self.column == value, tie))
+        if self.column.nullable:
+            condition = or_(condition, self.column.is_(None))
+        return condition
+
+    def finish(self, rows: List) -> List:
+        rows = list(rows)
+        if self.limit > 0 and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            last = rows[-1]
+            self.next_cursor = encode_cursor(
+                self.sort, getattr(last, self.sort_name), last.id
+            )
+        return rows[:max(self.limit, 0)]
+
+    def set_header(self, response) -> None:
+        if self.next_cursor:
+            response.headers[CURSOR_HEADER] = self.next_cursor
@@ -0,0 +1,54 @@
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
+
+from .fast_json import dumps, row_dicts
+
+load_dotenv()
+
+# Сколько строк читается из серверного курсора за один раз
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+# Допустимые значения параметра ?stream=
+STREAM_FORMATS = "^(ndjson|json)$"
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def streaming_list_response(
+    session_factory,
+    stmt,
+    schema,
+    stream_format: str,
+    fast: bool = False,
+    fields: Optional[List[str]] = None
+) -> StreamingResponse:
+    # Строки сериализуются по мере чтения курсора, поэтому память не зависит от
+    # размера выборки, а первый байт уходит клиенту сразу после первой порции.
+    # В быстром режиме stmt выбирает колонки, а не объекты модели; fields
+    # оставляет в каждой строке только запрошенные поля
+    async def generate():
+        if stream_format == "json":
+            yield "["
+        separator = ""
+        async with session_factory() as db:
+            result = await db.stream(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+            partitions = result.partitions() if fast else result.scalars().partitions()
+            async for partition in partitions:
+                if fast:
+                    encoded = [dumps(row).decode() for row in row_dicts(partition, fields)]
+                else:
+                    encoded = [schema.model_validate(row).model_dump_json() for row in partition]
+                if stream_format == "ndjson":
+                    yield "\n".join(encoded) + "\n"
+                else:
+                    yield separator + ",".join(encoded)
+                    separator = ","
+        if stream_format == "json":
+            yield "]"
+
+    return StreamingResponse(generate(), media_type=MEDIA_TYPES[stream_format])
@@ -1,40 +1,84 @@
+import os
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
-from main import app
-from src.database.database import Base, get_db
+# Минимальная стоимость bcrypt, чтобы тесты не тратили время на хеширование
+os.environ.setdefault("BCRYPT_ROUNDS", "5")
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+from main import app
+from src.database.database import Base, get_session_factory
+from src.auth.auth import user_cache
+from src.auth.revocation import revocations
+from src.cache.responses import catalog_cache
+from src.database.replicas import recent_writes
+from src.limits.admission import admission
+from src.limits.buckets import buckets
+from src.metrics.database import install_query_metrics
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Файловая SQLite во временном каталоге: ее видят и синхронный движок теста,
+# и асинхронный движок приложения
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / "test.db"
 
 @pytest.fixture
-def test_db():
+def test_db(database_path):
+    engine = create_engine(
+        f"sqlite:///{database_path}",
+        connect_args={"check_same_thread": False},
+    )
     Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = TestingSessionLocal()
     try:
-        db = TestingSessionLocal()
         yield db
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        engine.dispose()
 
 @pytest.fixture
-def client(test_db):
-    def override_get_db():
-        try:
-            yield test_db
-        finally:
-            test_db.close()
-    
-    app.dependency_overrides[get_db] = override_get_db
+def async_engine(test_db, database_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool)
+    install_query_metrics(engine, "async")
+    return engine
+
+@pytest.fixture
+def client(async_engine):
+    TestingAsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    app.dependency_overrides[get_session_factory] = lambda: TestingAsyncSessionLocal
+    user_cache.clear()
+    catalog_cache.clear()
+    revocations.clear()
+    buckets.clear()
+    admission.reset()
+    recent_writes.clear()
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
+    user_cache.clear()
+    catalog_cache.clear()
+    revocations.clear()
+    buckets.clear()
+    admission.reset()
+    recent_writes.clear()
+
+@pytest.fixture
+def auth_headers(client):
+    client.post(
+        "/register",
+        json={"email": "librarian@example.com", "password": "password123"}
+    )
+    response = client.post(
+        "/token",
+        data={"username": "librarian@example.com", "password": "password123"}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
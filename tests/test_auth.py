@@ -0,0 +1,251 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from passlib.context import CryptContext
+from sqlalchemy import update
+
+from src.auth import auth
+from src.auth.auth import client_key, create_access_token, user_cache
+from src.auth.hashing import HashingPool, hashing_pool, pwd_context
+from src.auth.revocation import INACTIVE, REVOKED, RevocationList, revocations
+from src.cache.lru import MISSING, TTLCache
+from src.models.models import User as UserModel
+
+
+def test_ttl_cache_expiry_and_lru():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, timer=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" дольше всех не использовался и вытесняется
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    now[0] = 11
+    assert cache.get("a") is MISSING
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_byte_budget():
+    cache = TTLCache(maxsize=10, ttl=10, maxbytes=10, sizeof=len)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    # Бюджет превышен — вытесняется самая старая запись
+    cache.set("c", b"123")
+    assert cache.get("a") is MISSING
+    assert cache.stats()["bytes"] == 8
+    # Значение больше бюджета не кэшируется вовсе
+    cache.set("d", b"12345678901")
+    assert cache.get("d") is MISSING
+    assert cache.get("b") == b"12345"
+
+
+def test_current_user_is_cached_and_invalidated(client, test_db, auth_headers):
+    # Токен старого формата (только sub) проверяется по базе через кэш пользователей
+    legacy_headers = {
+        "Authorization": f"Bearer {create_access_token({'sub': 'librarian@example.com'})}"
+    }
+    assert client.get("/readers/readers/", headers=legacy_headers).status_code == 200
+    misses = user_cache.misses
+    assert client.get("/readers/readers/", headers=legacy_headers).status_code == 200
+    assert user_cache.misses == misses
+    assert user_cache.hits >= 1
+
+    # Деактивация пользователя сразу сбрасывает закэшированную запись и
+    # действует на токены с claims, хотя в них записано act=true
+    user = test_db.query(UserModel).filter(UserModel.email == "librarian@example.com").first()
+    user.is_active = False
+    test_db.commit()
+    for headers in (legacy_headers, auth_headers):
+        response = client.get("/readers/readers/", headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Inactive user"
+
+
+def test_token_claims_and_revocation(client, test_db, auth_headers):
+    token = auth_headers["Authorization"].split()[1]
+    claims = jwt.get_unverified_claims(token)
+    assert (claims["sub"], claims["uid"], claims["act"], claims["ver"]) == (
+        "librarian@example.com", 1, True, 0
+    )
+
+    # Подписанного токена достаточно: пользователь не читается ни из кэша, ни из базы
+    client.get("/readers/readers/", headers=auth_headers)
+    lookups = user_cache.hits + user_cache.misses
+    assert client.get("/readers/readers/", headers=auth_headers).status_code == 200
+    assert user_cache.hits + user_cache.misses == lookups
+
+    second = client.post(
+        "/token", data={"username": "librarian@example.com", "password": "password123"}
+    ).json()["access_token"]
+    assert client.post("/logout", headers=auth_headers).status_code == 200
+    # Выход отзывает все выданные токены, включая второй
+    for old_token in (token, second):
+        response = client.get("/readers/readers/", headers={"Authorization": f"Bearer {old_token}"})
+        assert response.status_code == 401
+
+    fresh = client.post(
+        "/token", data={"username": "librarian@example.com", "password": "password123"}
+    ).json()["access_token"]
+    assert jwt.get_unverified_claims(fresh)["ver"] == 1
+    assert client.get(
+        "/readers/readers/", headers={"Authorization": f"Bearer {fresh}"}
+    ).status_code == 200
+
+    # Другой воркер узнает об отзыве при обновлении списка из базы
+    revocations.clear()
+    assert revocations.stale
+    response = client.get("/readers/readers/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert revocations.stats()["entries"] == 1
+
+
+def test_client_key_decodes_token_once_per_request(monkeypatch):
+    decoded = []
+    decode = auth.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decoded.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counting_decode)
+    token = create_access_token({"sub": "reader@example.com", "uid": 7})
+    scope = {"headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("1.2.3.4", 1)}
+    # Лимиты, отметка записи и выбор реплики спрашивают ключ в одном запросе
+    assert [client_key(scope) for _ in range(3)] == ["user:7"] * 3
+    assert scope["state"]["client_key"] == "user:7"
+    assert len(decoded) == 1
+    assert client_key({"headers": [], "client": ("1.2.3.4", 1)}) == "ip:1.2.3.4"
+
+
+def test_revocation_list_refresh_interval():
+    now = [0.0]
+    revocations_list = RevocationList(refresh_seconds=30, timer=lambda: now[0])
+    assert revocations_list.stale
+    revocations_list.update(1, 0, True)
+    assert revocations_list.stats()["entries"] == 0
+    revocations_list.update(1, 2, True)
+    assert revocations_list.check(1, 1) == REVOKED
+    assert revocations_list.check(1, 2) is None
+    assert revocations_list.check(2, 0) is None
+    revocations_list.update(1, 2, False)
+    assert revocations_list.check(1, 2) == INACTIVE
+
+
+def test_revocation_list_keeps_deleted_users_and_drops_old_changes(
+    client, test_db, auth_headers, monkeypatch
+):
+    # Каждый запрос перечитывает список из базы, как после REVOCATION_REFRESH_SECONDS
+    monkeypatch.setattr(revocations, "refresh_seconds", 0)
+    assert client.post("/logout", headers=auth_headers).status_code == 200
+    user = test_db.query(UserModel).one()
+    assert user.tokens_changed_at is not None
+    assert revocations.stats()["entries"] == 1
+
+    # Выход, случившийся раньше времени жизни токена, в список больше не читается
+    user.tokens_changed_at = datetime.utcnow() - timedelta(hours=2)
+    test_db.commit()
+    revocations.clear()
+    client.get("/readers/readers/", headers=auth_headers)
+    assert revocations.stats()["entries"] == 0
+
+    # Строки удаленного пользователя в базе нет, но обновление списка не
+    # должно вернуть его токенам силу
+    token = client.post(
+        "/token", data={"username": "librarian@example.com", "password": "password123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/readers/readers/", headers=headers).status_code == 200
+    test_db.delete(user)
+    test_db.commit()
+    for _ in range(2):
+        assert client.get("/readers/readers/", headers=headers).status_code == 400
+    assert revocations.refreshes >= 2
+
+
+def test_bulk_deactivation_reaches_revocation_list(client, test_db, auth_headers, monkeypatch):
+    # Деактивация в обход ORM (скрипт, другой сервис) тоже отмечается в базе
+    monkeypatch.setattr(revocations, "refresh_seconds", 0)
+    assert client.get("/readers/readers/", headers=auth_headers).status_code == 200
+    test_db.execute(update(UserModel).values(is_active=False))
+    test_db.commit()
+    assert test_db.query(UserModel.tokens_changed_at).scalar() is not None
+    revocations.clear()
+    response = client.get("/readers/readers/", headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Inactive user"
+
+
+def test_hashing_pool_rejects_when_saturated():
+    pool = HashingPool(workers=1, queue_depth=0)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as error:
+            await pool.run(lambda: None)
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "1"
+        release.set()
+        await first
+        # После освобождения слота запросы снова принимаются
+        assert await pool.run(lambda: 42) == 42
+
+    asyncio.run(run())
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_outdated_hash_is_rehashed_on_login(client, test_db):
+    # Хеш с меньшим числом раундов, чем требует текущая конфигурация
+    old_hash = CryptContext(schemes=["bcrypt"]).hash("password123", rounds=4)
+    test_db.add(UserModel(email="old@example.com", hashed_password=old_hash, is_active=True))
+    test_db.commit()
+
+    response = client.post(
+        "/token", data={"username": "old@example.com", "password": "password123"}
+    )
+    assert response.status_code == 200
+    test_db.expire_all()
+    user = test_db.query(UserModel).filter(UserModel.email == "old@example.com").first()
+    assert user.hashed_password != old_hash
+    assert not pwd_context.needs_update(user.hashed_password)
+
+
+def test_refresh_token_rotation_and_reuse_detection(client, auth_headers):
+    response = client.post(
+        "/token", data={"username": "librarian@example.com", "password": "password123"}
+    )
+    tokens = response.json()
+    assert tokens["refresh_token"] and tokens["expires_in"] > 0
+
+    # Продление не проверяет пароль, bcrypt не вызывается
+    completed = hashing_pool.stats()["completed"]
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert hashing_pool.stats()["completed"] == completed
+    headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+    assert client.get("/readers/readers/", headers=headers).status_code == 200
+
+    # Старый токен предъявлен повторно: отзывается вся цепочка, включая новый
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": "unknown"})
+    assert response.status_code == 401
+
+    # Выход отзывает refresh-токены, полученные при других входах
+    other = client.post(
+        "/token", data={"username": "librarian@example.com", "password": "password123"}
+    ).json()
+    client.post("/logout", headers={"Authorization": f"Bearer {other['access_token']}"})
+    response = client.post("/token/refresh", json={"refresh_token": other["refresh_token"]})
+    assert response.status_code == 401
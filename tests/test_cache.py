@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+from fastapi import HTTPException
+
+from src.cache.backends import MemoryBackend, SQLiteBackend
+from src.cache.lru import MISSING
+from src.cache.singleflight import SingleFlight
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    # Два экземпляра на одном файле ведут себя как два воркера
+    path = str(tmp_path / "cache.db")
+    first = SQLiteBackend(path, table="cache_test", maxsize=100, ttl=60)
+    second = SQLiteBackend(path, table="cache_test", maxsize=100, ttl=60)
+
+    key = "book:1@{}".format(*first.versions("book:1"))
+    first.set(key, {"title": "Shared"})
+    assert second.get(key) == {"title": "Shared"}
+
+    # Запись во втором воркере делает ключ первого недостижимым
+    second.bump("book:1")
+    assert first.versions("book:1") == (1,)
+    assert "book:1@{}".format(*first.versions("book:1")) != key
+    assert first.get("book:1@1") is MISSING
+
+
+def test_sqlite_backend_expiry_and_pruning(tmp_path):
+    now = [1000.0]
+    backend = SQLiteBackend(
+        str(tmp_path / "cache.db"), table="cache_test", maxsize=2, ttl=10,
+        maxbytes=20, timer=lambda: now[0]
+    )
+    backend.set("a", "x" * 5)
+    backend.set("b", "y" * 5, ttl=20)
+    backend.set("c", "z" * 5, ttl=30)
+    now[0] += 11
+    assert backend.get("a") is MISSING
+    assert backend.get("b") == "y" * 5
+
+    # Просроченные и самые старые сверх maxsize записи удаляются
+    assert backend.prune() == 1
+    backend.set("d", "w" * 15, ttl=40)
+    backend.prune()
+    assert backend.get("c") is MISSING
+    assert backend.get("d") == "w" * 15
+    assert backend.stats()["bytes"] <= 20
+
+
+def test_sqlite_backend_async_calls_leave_event_loop(tmp_path):
+    # Запросы к общему кэшу из обработчиков не должны блокировать event loop
+    backend = SQLiteBackend(str(tmp_path / "cache.db"), table="cache_test", maxsize=10, ttl=60)
+    threads = set()
+    connection = backend._connection
+
+    def tracked_connection():
+        threads.add(threading.get_ident())
+        return connection()
+
+    backend._connection = tracked_connection
+
+    async def main():
+        await backend.aset("a", 1)
+        await backend.abump("books")
+        return threading.get_ident(), await backend.aget("a"), await backend.aversions("books")
+
+    loop_thread, value, versions = asyncio.run(main())
+    assert (value, versions) == (1, (1,))
+    assert threads and loop_thread not in threads
+
+
+def test_memory_backend_versions():
+    backend = MemoryBackend(maxsize=10, ttl=60)
+    assert backend.versions("books", "book:1") == (0, 0)
+    backend.bump("book:1")
+    backend.bump("book:1")
+    assert backend.versions("books", "book:1") == (0, 2)
+
+
+def test_singleflight_coalesces_identical_reads():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"title": "Featured"}
+
+    async def missing():
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("book:1@0", load) for _ in range(10)))
+        errors = await asyncio.gather(
+            *(flight.do("book:2@0", missing) for _ in range(3)), return_exceptions=True
+        )
+        # После завершения загрузки следующий запрос снова идет в базу
+        await flight.do("book:1@0", load)
+        return results, errors
+
+    results, errors = asyncio.run(main())
+    assert len(calls) == 2
+    assert all(result is results[0] for result in results)
+    assert [error.status_code for error in errors] == [404, 404, 404]
+    assert flight.stats() == {
+        "in_flight": 0, "leaders": 3, "coalesced": 11, "coalesced_ratio": round(11 / 14, 4)
+    }
+
+
+def test_singleflight_waiter_takes_over_cancelled_leader():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", load))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == 2
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.cache.responses import catalog_cache
+from src.database import database
+from src.database.database import Base, replica_sessionmaker
+from src.database.pool import engine_options, install_sqlite_pragmas, pool_statistics
+from src.database.replicas import recent_writes
+from src.models.models import Book
+
+
+def test_sqlite_engine_options(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, **engine_options(url))
+    install_sqlite_pragmas(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    stats = pool_statistics(engine)
+    assert stats["checkouts"] == 1
+    assert stats["checked_out"] == 0
+    engine.dispose()
+
+
+def test_async_pool_statistics(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}"
+    engine = create_async_engine(url, **engine_options(url, is_async=True))
+
+    async def run_queries():
+        for _ in range(3):
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        await engine.dispose()
+
+    asyncio.run(run_queries())
+    stats = pool_statistics(engine)
+    assert stats["pool"] == "InstrumentedAsyncQueuePool"
+    assert stats["checkouts"] == 3
+    assert stats["timeouts"] == 0
+
+
+def test_memory_database_keeps_default_pool():
+    options = engine_options("sqlite:///:memory:")
+    assert "poolclass" not in options
+    assert options["connect_args"] == {"check_same_thread": False}
+
+
+@pytest.fixture
+def replica_engine(client, tmp_path, monkeypatch):
+    # Второй файл SQLite со схемой, но без данных, изображает отстающую реплику
+    replica_path = tmp_path / "replica.db"
+    replica_sync = create_engine(f"sqlite:///{replica_path}")
+    Base.metadata.create_all(bind=replica_sync)
+    replica = create_async_engine(f"sqlite+aiosqlite:///{replica_path}", poolclass=NullPool)
+    # Список реплик читают и зависимости, и ReadYourWritesMiddleware
+    monkeypatch.setattr(database, "ReplicaSessionLocals", [replica_sessionmaker(replica)])
+    yield replica_sync
+    replica_sync.dispose()
+
+
+def test_writes_are_not_marked_without_replicas(client, auth_headers):
+    response = client.post(
+        "/books/books/", json={"title": "Primary", "author": "A"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert recent_writes.stats()["size"] == 0
+
+
+def test_reads_use_replica_except_after_own_write(client, auth_headers, replica_engine):
+    # Регистрация и вход в auth_headers тоже записи: сбрасываем отметку анонимного клиента
+    recent_writes.clear()
+
+    book_id = client.post(
+        "/books/books/", json={"title": "Fresh", "author": "Primary"}, headers=auth_headers
+    ).json()["id"]
+
+    # Другие клиенты читают реплику, где книги еще нет
+    assert client.get(f"/books/books/{book_id}").status_code == 404
+    assert client.get("/books/books/", params={"author": "Primary"}).json() == []
+
+    # Автор записи читает основную базу, минуя кэш и реплику
+    assert client.get(f"/books/books/{book_id}", headers=auth_headers).json()["title"] == "Fresh"
+    assert [book["title"] for book in client.get(
+        "/books/books/", params={"author": "Primary"}, headers=auth_headers
+    ).json()] == ["Fresh"]
+    assert client.get("/borrowed-books/borrowed-books/", headers=auth_headers).status_code == 200
+
+    # Когда окно после записи истекло, автор снова читает реплику
+    recent_writes.clear()
+    assert client.get(
+        f"/books/books/{book_id}", params={"fields": "title"}, headers=auth_headers
+    ).status_code == 404
+
+
+def test_lagging_replica_reads_are_not_cached(client, auth_headers, replica_engine):
+    recent_writes.clear()
+    book = {"title": "Lagging", "author": "Replica"}
+    book_id = client.post("/books/books/", json=book, headers=auth_headers).json()["id"]
+
+    # Чтение другого клиента во время отставания реплики не попадает в кэш
+    response = client.get("/books/books/", params={"author": "Replica"})
+    assert response.json() == []
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    # Реплика догнала основную базу, окно после записи у автора истекло
+    with replica_engine.begin() as connection:
+        connection.execute(insert(Book).values(id=book_id, **book))
+    recent_writes.clear()
+    for headers in (auth_headers, {}):
+        titles = [item["title"] for item in client.get(
+            "/books/books/", params={"author": "Replica"}, headers=headers
+        ).json()]
+        assert titles == ["Lagging"]
+
+    # После REPLICA_STICKY_SECONDS ответы реплики снова кэшируются
+    catalog_cache.changes.clear()
+    response = client.get("/books/books/", params={"author": "Replica"})
+    assert response.headers["Cache-Control"].startswith("public")
@@ -1,6 +1,13 @@
+import json
 import pytest
-from fastapi import status
+from fastapi import HTTPException, status
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
 from src.auth.auth import create_access_token
+from src.metrics import profiling
+from src.models.models import Book, Reader
+from src.services import loans
+from src.utils.pagination import KeysetPage
 
 def test_create_user(client):
     response = client.post(
@@ -99,3 +106,679 @@ def test_return_nonexistent_book(client):
     response = client.post("/return/999", headers=headers)
     assert response.status_code == 404
     assert "not found" in response.json()["detail"]
+
+def test_books_cursor_pagination(client, auth_headers):
+    for title in ["Delta", "Alpha", "Charlie", "Echo", "Bravo"]:
+        client.post(
+            "/books/books/",
+            json={"title": title, "author": "Author"},
+            headers=auth_headers
+        )
+
+    # Листаем по курсору до конца, сортируя по названию
+    titles = []
+    params = {"limit": 2, "sort": "title"}
+    while True:
+        response = client.get("/books/books/", params=params)
+        assert response.status_code == 200
+        titles += [book["title"] for book in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["after"] = cursor
+    assert titles == ["Alpha", "Bravo", "Charlie", "Delta", "Echo"]
+
+    response = client.get("/books/books/", params={"limit": 2, "sort": "-id"})
+    first_page = [book["id"] for book in response.json()]
+    response = client.get(
+        "/books/books/",
+        params={"limit": 2, "sort": "-id", "after": response.headers["X-Next-Cursor"]}
+    )
+    assert [book["id"] for book in response.json()] == [first_page[1] - 1, first_page[1] - 2]
+
+    # Курсор от другой сортировки отклоняется
+    response = client.get("/books/books/", params={"sort": "title", "after": "bm90LWEtY3Vyc29y"})
+    assert response.status_code == 400
+
+def test_list_limit_and_skip_are_validated(client, auth_headers):
+    # Отрицательный LIMIT SQLite читает как "без ограничения", PostgreSQL отвергает
+    for path in ["/books/books/", "/readers/readers/", "/borrowed-books/borrowed-books/"]:
+        for params in [{"limit": -1}, {"limit": 0}, {"skip": -1}, {"limit": 10 ** 9}]:
+            response = client.get(path, params=params, headers=auth_headers)
+            assert response.status_code == 422, (path, params)
+    with pytest.raises(HTTPException):
+        KeysetPage(Book, {"id": Book.id}, limit=0)
+
+def test_list_filters_and_sorting(client, auth_headers):
+    books = [
+        {"title": "A", "author": "Tolstoy", "publication_year": 1869, "isbn": "978-5-00-000001-1"},
+        {"title": "B", "author": "Tolstoy", "publication_year": 1877, "copies_available": 0},
+        {"title": "C", "author": "Chekhov", "publication_year": 1901},
+        {"title": "D", "author": "Unknown"},
+    ]
+    for book in books:
+        client.post("/books/books/", json=book, headers=auth_headers)
+
+    def titles(**params):
+        return [book["title"] for book in client.get("/books/books/", params=params).json()]
+
+    assert titles(author="Tolstoy") == ["A", "B"]
+    assert titles(year_from=1870, year_to=1950) == ["B", "C"]
+    assert titles(available="false") == ["B"]
+    assert titles(isbn="9785000000011") == ["A"]
+    assert titles(author="Tolstoy", available="true") == ["A"]
+
+    # Книги без года идут в конце и при обратной сортировке, курсор их не теряет
+    result, params = [], {"sort": "-publication_year", "limit": 1}
+    while True:
+        response = client.get("/books/books/", params=params)
+        result += [book["title"] for book in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["after"] = response.headers["X-Next-Cursor"]
+    assert result == ["C", "B", "A", "D"]
+
+    for name in ["Anna", "Andrey", "Boris"]:
+        reader = {"name": name, "email": f"{name.lower()}@example.com"}
+        client.post("/readers/readers/", json=reader, headers=auth_headers)
+    response = client.get(
+        "/readers/readers/", params={"name": "An", "sort": "name"}, headers=auth_headers
+    )
+    assert [reader["name"] for reader in response.json()] == ["Andrey", "Anna"]
+
+    reader_id = response.json()[0]["id"]
+    borrow_ids = [
+        client.post(
+            "/borrowed-books/borrow/",
+            json={"book_id": book_id, "reader_id": reader_id},
+            headers=auth_headers
+        ).json()["id"]
+        for book_id in (1, 3)
+    ]
+    client.post(f"/borrowed-books/return/{borrow_ids[0]}", headers=auth_headers)
+    response = client.get(
+        "/borrowed-books/borrowed-books/",
+        params={"reader_id": reader_id, "active": "true"},
+        headers=auth_headers
+    )
+    assert [borrow["id"] for borrow in response.json()] == [borrow_ids[1]]
+
+def test_book_reads_are_cached_with_etags(client, auth_headers):
+    book_id = client.post(
+        "/books/books/",
+        json={"title": "Cached", "author": "Author", "copies_available": 1},
+        headers=auth_headers
+    ).json()["id"]
+
+    response = client.get(f"/books/books/{book_id}")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    response = client.get(f"/books/books/{book_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    list_etag = client.get("/books/books/").headers["ETag"]
+    assert client.get("/books/books/", headers={"If-None-Match": list_etag}).status_code == 304
+
+    # Выдача меняет copies_available — и карточка, и список получают новый ETag
+    reader_id = client.post(
+        "/readers/readers/",
+        json={"name": "Reader", "email": "cached@example.com"},
+        headers=auth_headers
+    ).json()["id"]
+    client.post(
+        "/borrowed-books/borrow/",
+        json={"book_id": book_id, "reader_id": reader_id},
+        headers=auth_headers
+    )
+    response = client.get(f"/books/books/{book_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["copies_available"] == 0
+    assert client.get("/books/books/", headers={"If-None-Match": list_etag}).status_code == 200
+
+    client.put(
+        f"/books/books/{book_id}",
+        json={"title": "Renamed", "author": "Author", "copies_available": 0},
+        headers=auth_headers
+    )
+    assert client.get(f"/books/books/{book_id}").json()["title"] == "Renamed"
+
+def test_metrics_endpoint(client, auth_headers):
+    def scrape():
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        return dict(
+            line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#")
+        )
+
+    before = scrape()
+    book_id = client.post(
+        "/books/books/", json={"title": "Measured", "author": "Author"}, headers=auth_headers
+    ).json()["id"]
+    client.get(f"/books/books/{book_id}")
+    client.get("/no-such-page")
+    after = scrape()
+
+    def delta(sample):
+        return float(after[sample]) - float(before.get(sample, 0))
+
+    # Метки содержат шаблон маршрута, а не конкретный URL
+    route = 'method="GET",route="/books/books/{book_id}"'
+    assert delta(f'http_requests_total{{{route},status="200"}}') == 1
+    assert delta(f"http_request_duration_seconds_count{{{route}}}") == 1
+    assert delta('http_requests_total{method="GET",route="unmatched",status="404"}') == 1
+    # Создание книги — это хотя бы один SQL-запрос внутри HTTP-запроса
+    assert delta('http_request_db_queries_sum{method="POST",route="/books/books/"}') >= 1
+    assert 'password_hash_duration_seconds_count{operation="hash"}' in after
+    # Учитывается и сам запрос к /metrics
+    assert after["http_requests_in_flight"] == "1"
+
+def test_request_profiling_and_slow_queries(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0.000001)
+
+    # Без заголовка запрос не профилируется
+    response = client.get("/books/books/")
+    assert "X-Profile-Id" not in response.headers
+
+    response = client.post(
+        "/books/books/",
+        json={"title": "Profiled", "author": "Author"},
+        headers={**auth_headers, "X-Profile": "secret"}
+    )
+    profile_id = int(response.headers["X-Profile-Id"])
+
+    # Профили читаются только с токеном профилирования, токена пользователя мало
+    assert client.get("/system/profiles", headers=auth_headers).status_code == 403
+    assert client.get("/system/slow-queries", headers=auth_headers).status_code == 403
+    profile_headers = {"X-Profile": "secret"}
+
+    profiles = client.get("/system/profiles", headers=profile_headers).json()
+    assert profiles[0]["id"] == profile_id
+    assert profiles[0]["route"] == "/books/books/"
+    profile = client.get(f"/system/profiles/{profile_id}", headers=profile_headers).json()
+    assert any(query["sql"].startswith("INSERT INTO books") for query in profile["queries"])
+    assert "cumulative" in profile["stats"]
+    # Параметры SQL по умолчанию не сохраняются
+    assert all(query["parameters"] is None for query in profile["queries"])
+
+    slow = client.get("/system/slow-queries", headers=profile_headers).json()
+    assert any("INSERT INTO books" in query["sql"] for query in slow)
+
+    # Если параметры включены, значения из users и refresh_tokens скрываются
+    monkeypatch.setattr(profiling, "PROFILE_SQL_PARAMETERS", True)
+    client.post("/token", data={"username": "librarian@example.com", "password": "password123"})
+    slow = client.get("/system/slow-queries", headers=profile_headers).json()
+    login = [query for query in slow if query["sql"].startswith("SELECT users.id, users.email")]
+    assert login and all(query["parameters"] == profiling.REDACTED for query in login)
+    assert all("librarian@example.com" not in str(query["parameters"]) for query in slow)
+
+def test_fast_list_mode_matches_regular_responses(client, auth_headers):
+    for i in range(3):
+        client.post(
+            "/books/books/",
+            json={"title": f"Книга {i}", "author": "Автор", "publication_year": 2000 + i},
+            headers=auth_headers
+        )
+    reader_id = client.post(
+        "/readers/readers/",
+        json={"name": "Fast Reader", "email": "fast@example.com"},
+        headers=auth_headers
+    ).json()["id"]
+    borrow_id = client.post(
+        "/borrowed-books/borrow/",
+        json={"book_id": 1, "reader_id": reader_id},
+        headers=auth_headers
+    ).json()["id"]
+    client.post(f"/borrowed-books/return/{borrow_id}", headers=auth_headers)
+
+    for url in ["/books/books/", "/readers/readers/", "/borrowed-books/borrowed-books/"]:
+        params = {"limit": 2, "sort": "-id"}
+        regular = client.get(url, params=params, headers=auth_headers)
+        fast = client.get(url, params={**params, "fast": "true"}, headers=auth_headers)
+        assert fast.json() == regular.json()
+        assert fast.headers.get("X-Next-Cursor") == regular.headers.get("X-Next-Cursor")
+
+        params["stream"] = "ndjson"
+        regular = client.get(url, params=params, headers=auth_headers)
+        fast = client.get(url, params={**params, "fast": "true"}, headers=auth_headers)
+        assert fast.text.splitlines() and fast.text == regular.text
+
+def test_sparse_fieldsets(client, auth_headers):
+    for i in range(3):
+        client.post(
+            "/books/books/",
+            json={"title": f"Книга {i}", "author": "Автор", "publication_year": 2000 + i,
+                  "description": "Длинное описание " * 20},
+            headers=auth_headers
+        )
+
+    # Сортировка по колонке, которой нет в ответе: курсор все равно строится
+    params = {"fields": "title,author", "sort": "-publication_year", "limit": 2}
+    response = client.get("/books/books/", params=params)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": 3, "title": "Книга 2", "author": "Автор"},
+        {"id": 2, "title": "Книга 1", "author": "Автор"},
+    ]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/books/books/", params={**params, "after": cursor})
+    assert response.json() == [{"id": 1, "title": "Книга 0", "author": "Автор"}]
+
+    response = client.get("/books/books/1", params={"fields": "title"})
+    assert response.json() == {"id": 1, "title": "Книга 0"}
+    assert "description" in client.get("/books/books/1").json()
+    assert client.get("/books/books/99", params={"fields": "title"}).status_code == 404
+
+    response = client.get("/books/books/", params={"fields": "title,secret"})
+    assert response.status_code == 400
+    assert "secret" in response.json()["detail"]
+
+    response = client.get(
+        "/books/books/", params={"fields": "isbn", "stream": "ndjson", "limit": 2}
+    )
+    assert response.text == '{"isbn":null,"id":1}\n{"isbn":null,"id":2}\n'
+
+    reader_id = client.post(
+        "/readers/readers/",
+        json={"name": "Sparse Reader", "email": "sparse@example.com"},
+        headers=auth_headers
+    ).json()["id"]
+    response = client.get(
+        f"/readers/readers/{reader_id}", params={"fields": "name"}, headers=auth_headers
+    )
+    assert response.json() == {"id": reader_id, "name": "Sparse Reader"}
+    response = client.get("/readers/readers/", params={"fields": "email"}, headers=auth_headers)
+    assert response.json() == [{"id": reader_id, "email": "sparse@example.com"}]
+
+    client.post(
+        "/borrowed-books/borrow/", json={"book_id": 1, "reader_id": reader_id}, headers=auth_headers
+    )
+    for url in [f"/borrowed-books/borrowed-books/reader/{reader_id}",
+                "/borrowed-books/borrowed-books/"]:
+        response = client.get(url, params={"fields": "book_id"}, headers=auth_headers)
+        assert response.json() == [{"id": 1, "book_id": 1}]
+
+def test_expand_borrowed_books_with_fixed_query_count(client, auth_headers, async_engine):
+    reader_ids = []
+    for i in range(3):
+        client.post(
+            "/books/books/",
+            json={"title": f"Book {i}", "author": "Author", "copies_available": 5},
+            headers=auth_headers
+        )
+        reader_ids.append(client.post(
+            "/readers/readers/",
+            json={"name": f"Reader {i}", "email": f"expand{i}@example.com"},
+            headers=auth_headers
+        ).json()["id"])
+    for reader_id in reader_ids:
+        for book_id in (1, 2, 3):
+            client.post(
+                "/borrowed-books/borrow/",
+                json={"book_id": book_id, "reader_id": reader_id},
+                headers=auth_headers
+            )
+
+    statements = []
+    event.listen(
+        async_engine.sync_engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement)
+    )
+
+    def get(url, **params):
+        statements.clear()
+        response = client.get(url, params=params, headers=auth_headers)
+        assert response.status_code == 200
+        return response, len(statements)
+
+    # Пользователь из токена уже в кэше: считаются только запросы самого списка
+    response, queries = get("/borrowed-books/borrowed-books/", expand="book,reader", limit=2)
+    assert queries == 3
+    first = response.json()[0]
+    assert first["book"] == client.get("/books/books/1").json()
+    assert first["reader"]["email"] == "expand0@example.com"
+    # Число запросов не зависит от размера страницы
+    response, queries = get("/borrowed-books/borrowed-books/", expand="book,reader", limit=9)
+    assert queries == 3 and len(response.json()) == 9
+    response, queries = get("/borrowed-books/borrowed-books/", expand="book", limit=9)
+    assert queries == 2 and "reader" not in response.json()[0]
+
+    response, queries = get(f"/borrowed-books/borrowed-books/reader/{reader_ids[1]}", expand="book")
+    assert queries == 3  # проверка читателя, выдачи, книги
+    assert [borrow["book"]["id"] for borrow in response.json()] == [1, 2, 3]
+
+    response = client.get(
+        "/borrowed-books/borrowed-books/", params={"expand": "user"}, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+def test_borrow_and_return_cycle(client, auth_headers):
+    book_id = client.post(
+        "/books/books/",
+        json={"title": "Single Copy", "author": "Author", "copies_available": 1},
+        headers=auth_headers
+    ).json()["id"]
+    reader_id = client.post(
+        "/readers/readers/",
+        json={"name": "Test Reader", "email": "reader@example.com"},
+        headers=auth_headers
+    ).json()["id"]
+
+    borrow = {"book_id": book_id, "reader_id": reader_id}
+    response = client.post("/borrowed-books/borrow/", json=borrow, headers=auth_headers)
+    assert response.status_code == 200
+    borrow_id = response.json()["id"]
+
+    # Экземпляров больше нет
+    response = client.post("/borrowed-books/borrow/", json=borrow, headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.post(f"/borrowed-books/return/{borrow_id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert client.get(f"/books/books/{book_id}").json()["copies_available"] == 1
+
+    # Повторный возврат запрещен
+    response = client.post(f"/borrowed-books/return/{borrow_id}", headers=auth_headers)
+    assert response.status_code == 400
+
+def test_concurrent_borrows_do_not_oversell(client, auth_headers):
+    import asyncio
+    import httpx
+    from main import app
+
+    book_id = client.post(
+        "/books/books/",
+        json={"title": "Popular", "author": "Author", "copies_available": 2},
+        headers=auth_headers
+    ).json()["id"]
+    reader_ids = [
+        client.post(
+            "/readers/readers/",
+            json={"name": f"Reader {i}", "email": f"reader{i}@example.com"},
+            headers=auth_headers
+        ).json()["id"]
+        for i in range(6)
+    ]
+
+    async def borrow_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*[
+                http.post(
+                    "/borrowed-books/borrow/",
+                    json={"book_id": book_id, "reader_id": reader_id},
+                    headers=auth_headers
+                )
+                for reader_id in reader_ids
+            ])
+
+    responses = asyncio.run(borrow_all())
+    assert sorted(r.status_code for r in responses) == [200, 200, 400, 400, 400, 400]
+    assert client.get(f"/books/books/{book_id}").json()["copies_available"] == 0
+
+def test_borrow_limit_per_reader(client, auth_headers):
+    reader_id = client.post(
+        "/readers/readers/",
+        json={"name": "Test Reader", "email": "reader@example.com"},
+        headers=auth_headers
+    ).json()["id"]
+    book_ids = [
+        client.post(
+            "/books/books/",
+            json={"title": f"Book {i}", "author": "Author"},
+            headers=auth_headers
+        ).json()["id"]
+        for i in range(4)
+    ]
+    for i, book_id in enumerate(book_ids):
+        response = client.post(
+            "/borrowed-books/borrow/",
+            json={"book_id": book_id, "reader_id": reader_id},
+            headers=auth_headers
+        )
+        assert response.status_code == (200 if i < 3 else 400)
+    assert "maximum number of books" in response.json()["detail"]
+    # Неудачная выдача не списала экземпляр
+    assert client.get(f"/books/books/{book_ids[3]}").json()["copies_available"] == 1
+
+    response = client.post(
+        "/borrowed-books/borrow/",
+        json={"book_id": book_ids[3], "reader_id": 999},
+        headers=auth_headers
+    )
+    assert response.status_code == 404
+
+def test_bulk_borrow_and_return(client, auth_headers):
+    book_id = client.post(
+        "/books/books/",
+        json={"title": "Bulk", "author": "Author", "copies_available": 4},
+        headers=auth_headers
+    ).json()["id"]
+    first, second = [
+        client.post(
+            "/readers/readers/",
+            json={"name": f"Reader {i}", "email": f"bulk{i}@example.com"},
+            headers=auth_headers
+        ).json()["id"]
+        for i in range(2)
+    ]
+
+    items = [{"book_id": book_id, "reader_id": first}] * 4 + [
+        {"book_id": book_id, "reader_id": second},
+        {"book_id": 999, "reader_id": second},
+    ]
+    response = client.post(
+        "/borrowed-books/borrow/bulk/", json={"items": items}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 4
+    assert [r["ok"] for r in data["results"]] == [True, True, True, False, True, False]
+    assert "maximum number of books" in data["results"][3]["detail"]
+    assert data["results"][5]["detail"] == "Book not found"
+    assert client.get(f"/books/books/{book_id}").json()["copies_available"] == 0
+
+    borrow_ids = [r["borrow"]["id"] for r in data["results"] if r["ok"]]
+    response = client.post(
+        "/borrowed-books/return/bulk/",
+        json={"borrow_ids": borrow_ids[:2] + [borrow_ids[0], 999]},
+        headers=auth_headers
+    )
+    data = response.json()
+    assert data["succeeded"] == 2
+    assert [r["ok"] for r in data["results"]] == [True, True, False, False]
+    assert data["results"][3]["detail"] == "Borrow record not found"
+    assert client.get(f"/books/books/{book_id}").json()["copies_available"] == 2
+
+def test_bulk_borrow_rejects_copies_taken_concurrently(
+    client, auth_headers, test_db, async_engine
+):
+    book_id = client.post(
+        "/books/books/",
+        json={"title": "Contended", "author": "Author", "copies_available": 2},
+        headers=auth_headers
+    ).json()["id"]
+    reader_ids = [
+        client.post(
+            "/readers/readers/",
+            json={"name": f"Reader {i}", "email": f"contended{i}@example.com"},
+            headers=auth_headers
+        ).json()["id"]
+        for i in range(2)
+    ]
+
+    # Параллельная выдача списывает экземпляр между чтением остатков и UPDATE
+    interleaved = []
+
+    def take_copy(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE books") and not interleaved:
+            interleaved.append(True)
+            test_db.execute(update(Book).values(copies_available=Book.copies_available - 1))
+            test_db.commit()
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", take_copy)
+    try:
+        response = client.post(
+            "/borrowed-books/borrow/bulk/",
+            json={"items": [{"book_id": book_id, "reader_id": r} for r in reader_ids]},
+            headers=auth_headers
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", take_copy)
+
+    assert interleaved and response.status_code == 409
+    test_db.expire_all()
+    assert test_db.get(Book, book_id).copies_available == 1
+    assert [r.active_loans for r in test_db.query(Reader).order_by(Reader.id)] == [0, 0]
+
+
+def test_reader_active_loan_counter(client, auth_headers, test_db):
+    book_id = client.post(
+        "/books/books/",
+        json={"title": "Counted", "author": "Author", "copies_available": 10},
+        headers=auth_headers
+    ).json()["id"]
+    reader_id = client.post(
+        "/readers/readers/",
+        json={"name": "Counted Reader", "email": "counted@example.com"},
+        headers=auth_headers
+    ).json()["id"]
+
+    def active_loans():
+        test_db.rollback()
+        return test_db.get(Reader, reader_id, populate_existing=True).active_loans
+
+    borrow = {"book_id": book_id, "reader_id": reader_id}
+    first = client.post("/borrowed-books/borrow/", json=borrow, headers=auth_headers).json()
+    bulk = client.post(
+        "/borrowed-books/borrow/bulk/", json={"items": [borrow] * 3}, headers=auth_headers
+    ).json()
+    assert bulk["succeeded"] == 2 and active_loans() == 3
+    response = client.post("/borrowed-books/borrow/", json=borrow, headers=auth_headers)
+    assert response.status_code == 400
+
+    client.post(f"/borrowed-books/return/{first['id']}", headers=auth_headers)
+    assert active_loans() == 2
+    borrow_ids = [r["borrow"]["id"] for r in bulk["results"] if r["ok"]]
+    client.post(
+        "/borrowed-books/return/bulk/", json={"borrow_ids": borrow_ids}, headers=auth_headers
+    )
+    assert active_loans() == 0
+    assert loans.find_mismatches(test_db) == []
+
+    # Счетчик не может уйти в минус, а разошедшийся пересчитывается
+    with pytest.raises(IntegrityError):
+        test_db.execute(update(Reader).values(active_loans=-1))
+    test_db.rollback()
+    test_db.execute(update(Reader).values(active_loans=2))
+    test_db.commit()
+    assert loans.find_mismatches(test_db) == [
+        {"id": reader_id, "active_loans": 2, "actual": 0}
+    ]
+    assert loans.repair_counters(test_db) == 1
+    assert active_loans() == 0
+
+def test_bulk_import_and_export_books(client, auth_headers):
+    client.post(
+        "/books/books/",
+        json={"title": "Old Title", "author": "Author", "isbn": "1234567890"},
+        headers=auth_headers
+    )
+    csv_data = (
+        "title,author,publication_year,isbn,copies_available\n"
+        "New Title,Author,2001,123-456-7890,3\n"
+        "\"Multi, line\nTitle\",Author,,,1\n"
+        ",No Title,,,1\n"
+        "Fresh,Author,1999,9781234567897,2\n"
+    )
+    response = client.post(
+        "/books/books/import",
+        params={"batch_size": 2},
+        files={"file": ("books.csv", csv_data, "text/csv")},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["processed"] == 4
+    assert (report["created"], report["updated"], report["failed"]) == (2, 1, 1)
+    assert report["errors"][0]["line"] == 5
+
+    ndjson_data = '{"title": "Json Book", "author": "Author"}\nnot json\n'
+    response = client.post(
+        "/books/books/import",
+        files={"file": ("books.ndjson", ndjson_data, "application/x-ndjson")},
+        headers=auth_headers
+    )
+    assert response.json()["created"] == 1
+    assert response.json()["failed"] == 1
+
+    # ISBN совпал — книга обновлена, а не задублирована
+    response = client.get("/books/books/export", headers=auth_headers)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [book["title"] for book in exported] == [
+        "New Title", "Multi, line\nTitle", "Fresh", "Json Book"
+    ]
+    assert exported[0]["copies_available"] == 3
+
+    response = client.get("/books/books/export", params={"format": "csv"}, headers=auth_headers)
+    assert response.text.startswith("id,title,author")
+
+def test_stream_list_responses(client, auth_headers):
+    for i in range(5):
+        client.post(
+            "/books/books/",
+            json={"title": f"Book {i}", "author": "Author"},
+            headers=auth_headers
+        )
+
+    response = client.get("/books/books/", params={"stream": "ndjson", "limit": 3})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [book["title"] for book in lines] == ["Book 0", "Book 1", "Book 2"]
+
+    response = client.get("/books/books/", params={"stream": "json", "sort": "-id"})
+    assert [book["title"] for book in response.json()] == [f"Book {i}" for i in range(4, -1, -1)]
+
+    response = client.get("/readers/readers/", params={"stream": "json"}, headers=auth_headers)
+    assert response.json() == []
+
+def test_full_text_search(client, auth_headers):
+    books = [
+        {"title": "The Lord of the Rings", "author": "J. R. R. Tolkien"},
+        {"title": "The Hobbit", "author": "J. R. R. Tolkien", "description": "There and back again"},
+        {"title": "Ring World", "author": "Larry Niven"},
+        {"title": "Silmarillion", "author": "Tolkien"},
+    ]
+    ids = [
+        client.post("/books/books/", json=book, headers=auth_headers).json()["id"]
+        for book in books
+    ]
+
+    response = client.get("/books/search", params={"q": "tolkien ring"})
+    assert [book["title"] for book in response.json()] == ["The Lord of the Rings"]
+
+    # Поиск по префиксу и постраничный курсор
+    response = client.get("/books/search", params={"q": "tolk", "limit": 2})
+    first_page = [book["id"] for book in response.json()]
+    response = client.get(
+        "/books/search",
+        params={"q": "tolk", "limit": 2, "after": response.headers["X-Next-Cursor"]}
+    )
+    assert len(first_page) == 2
+    assert sorted(first_page + [book["id"] for book in response.json()]) == ids[:2] + [ids[3]]
+
+    # Индекс следует за изменениями и удалениями книг
+    client.put(
+        f"/books/books/{ids[2]}",
+        json={"title": "Ringworld Engineers", "author": "Larry Niven"},
+        headers=auth_headers
+    )
+    client.delete(f"/books/books/{ids[0]}", headers=auth_headers)
+    response = client.get("/books/search", params={"q": "ring"})
+    assert [book["title"] for book in response.json()] == ["Ringworld Engineers"]
+
+    assert client.get("/books/search", params={"q": "back again"}).json()[0]["id"] == ids[1]
+    assert client.get("/books/search", params={"q": "***"}).status_code == 400
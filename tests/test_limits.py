@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.limits import middleware
+from src.limits.admission import BULK, LOGIN, admission, classify
+from src.limits.buckets import MemoryBuckets, SQLiteBuckets
+from src.limits.middleware import RateRule, parse_rate
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_token_bucket_refills_at_rate(tmp_path, backend):
+    now = [1000.0]
+    if backend == "memory":
+        buckets = MemoryBuckets(maxsize=100, timer=lambda: now[0])
+    else:
+        buckets = SQLiteBuckets(str(tmp_path / "ratelimit.db"), timer=lambda: now[0])
+
+    # Полная корзина пропускает всплеск, затем ждать токен 0.5 секунды
+    assert [buckets.take("client", rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("client", rate=2, burst=3) == pytest.approx(0.5)
+    assert buckets.take("other", rate=2, burst=3) == 0
+
+    now[0] += 0.5
+    assert buckets.take("client", rate=2, burst=3) == 0
+    # Простой не копит токены сверх burst
+    now[0] += 60
+    assert [buckets.take("client", rate=2, burst=3) for _ in range(4)][-1] > 0
+
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    first, second = SQLiteBuckets(path), SQLiteBuckets(path)
+    assert first.take("ip:1", rate=0.01, burst=1) == 0
+    assert second.take("ip:1", rate=0.01, burst=1) > 0
+    assert second.stats()["keys"] == 1
+
+
+def test_sqlite_buckets_take_is_atomic_across_connections(tmp_path):
+    # Каждый поток пишет через свое соединение: пропускается ровно burst запросов
+    buckets = SQLiteBuckets(str(tmp_path / "ratelimit.db"))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        waits = list(pool.map(lambda _: buckets.take("ip:1", rate=0.001, burst=20), range(60)))
+    assert waits.count(0) == 20
+
+
+def test_classify_expensive_operations():
+    assert parse_rate("10/minute") == (pytest.approx(10 / 60), 10)
+    assert parse_rate("0") == (0, 0)
+    assert classify("POST", "/token", b"") == LOGIN
+    assert classify("GET", "/books/books/", b"limit=100000") == BULK
+    assert classify("GET", "/books/books/", b"stream=ndjson") == BULK
+    assert classify("GET", "/books/books/", b"limit=50") is None
+    for limit in [b"-5", b"0", b"1e9", b"%C2%B2", b"abc"]:
+        assert classify("GET", "/books/books/", b"limit=" + limit) == BULK
+    assert classify("POST", "/borrowed-books/borrow/bulk/", b"") == BULK
+
+
+def test_login_rate_limit(client, monkeypatch):
+    monkeypatch.setattr(middleware, "RULES", [RateRule("login", 1 / 60, 2, LOGIN)])
+    form = {"username": "nobody@example.com", "password": "wrong"}
+    assert [client.post("/token", data=form).status_code for _ in range(2)] == [401, 401]
+
+    response = client.post("/token", data=form)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+    # Правило входа не трогает остальные маршруты
+    assert client.get("/books/books/").status_code == 200
+
+
+def test_admission_sheds_bulk_queries(client, monkeypatch):
+    monkeypatch.setitem(admission.limits, BULK, 1)
+    assert admission.try_acquire(BULK)
+    try:
+        response = client.get("/books/books/", params={"limit": 5000})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        # Обычные страницы проходят, пока тяжелые отклоняются
+        assert client.get("/books/books/", params={"limit": 50}).status_code == 200
+    finally:
+        admission.release(BULK)
+
+    assert client.get("/books/books/", params={"limit": 5000}).status_code == 200
+    assert admission.stats()[BULK] == {"limit": 1, "in_flight": 0, "rejected": 1}